@@ -0,0 +1,57 @@
+import math
+import sys
+import time
+
+from benchmarks.synthetic import generate_points, to_track_points
+from bot.services.calculator import (
+    PARITY_RTOL,
+    calculate_metrics,
+    calculate_metrics_scalar,
+)
+
+
+def check_parity(points) -> None:
+    fast = calculate_metrics(points)
+    reference = calculate_metrics_scalar(points)
+
+    assert fast.keys() == reference.keys(), (fast.keys(), reference.keys())
+    for key, expected in reference.items():
+        actual = fast[key]
+        if isinstance(expected, float):
+            assert math.isclose(actual, expected, rel_tol=PARITY_RTOL), key
+        elif key == "duration":
+            assert abs(actual - expected) <= 1, key
+        else:
+            assert actual == expected, key
+
+
+def best_of(func, points, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(points)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(sizes=(1_000, 10_000, 100_000)):
+    for with_elevation in (True, False):
+        for with_time in (True, False):
+            points = generate_points(500, with_elevation, with_time)
+            check_parity(points)
+            check_parity(to_track_points(points))
+    print("parity: ok")
+
+    for n in sizes:
+        points = generate_points(n)
+        scalar = best_of(calculate_metrics_scalar, points)
+        # parse_gpx hands the engine columnar points, so measure that form
+        vectorized = best_of(calculate_metrics, to_track_points(points))
+        print(
+            f"{n:>8} points: scalar {scalar * 1000:8.1f} ms, "
+            f"vectorized {vectorized * 1000:8.1f} ms ({scalar / vectorized:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (1_000, 10_000, 100_000))
@@ -0,0 +1,116 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from datetime import date
+
+from bot.services.graphics import (
+    create_infographic,
+    generate_elevation_data,
+    generate_speed_data,
+    get_summary_text,
+)
+
+METRICS = {
+    "distance": 18_400.0,
+    "duration": 3 * 3600 + 25 * 60,
+    "avg_speed": 5.4,
+    "max_speed": 11.2,
+    "min_elevation": 112.0,
+    "max_elevation": 141.0,
+    "elevation_gain": 36.0,
+    "trip_date": date(2024, 6, 1),
+}
+
+
+def render_with_pyplot(metrics: dict, output_path: str):
+    # The pre-Figure-API renderer, kept here as the "before" baseline
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    has_elevation = metrics.get("min_elevation") is not None
+    if has_elevation:
+        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
+    else:
+        fig, ax1 = plt.subplots(1, 1, figsize=(10, 5))
+
+    speed_data = generate_speed_data(metrics)
+    ax1.plot(speed_data["times"], speed_data["speeds"], color="#3498db", linewidth=2)
+    ax1.set_title("Скорость", fontsize=12, fontweight="bold")
+    ax1.set_ylabel("км/ч")
+    ax1.grid(True, alpha=0.3)
+    ax1.fill_between(
+        speed_data["times"], speed_data["speeds"], alpha=0.3, color="#3498db"
+    )
+
+    if has_elevation:
+        elevation_data = generate_elevation_data(metrics)
+        ax2.plot(
+            elevation_data["distances"],
+            elevation_data["elevations"],
+            color="#27ae60",
+            linewidth=2,
+        )
+        ax2.set_title("Высота", fontsize=12, fontweight="bold")
+        ax2.set_xlabel("Расстояние (км)")
+        ax2.set_ylabel("м")
+        ax2.grid(True, alpha=0.3)
+        ax2.fill_between(
+            elevation_data["distances"],
+            elevation_data["elevations"],
+            alpha=0.3,
+            color="#27ae60",
+        )
+
+    fig.text(
+        0.5,
+        0.95,
+        get_summary_text(metrics),
+        ha="center",
+        va="top",
+        fontsize=11,
+        bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.5),
+    )
+
+    plt.tight_layout()
+    plt.subplots_adjust(top=0.85 if has_elevation else 0.8)
+    plt.savefig(output_path, dpi=150, bbox_inches="tight")
+    plt.close()
+
+
+def renders_per_second(render, output_dir: str, count: int, threads: int = 1):
+    def worker(index: int):
+        for i in range(count):
+            render(METRICS, os.path.join(output_dir, f"bench_{index}_{i}.png"))
+
+    # Warm up fonts and templates outside the timed region
+    render(METRICS, os.path.join(output_dir, "warmup.png"))
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return count * threads / (time.perf_counter() - started)
+
+
+def main(count: int = 20):
+    warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+    with tempfile.TemporaryDirectory() as output_dir:
+        before = renders_per_second(render_with_pyplot, output_dir, count)
+        after = renders_per_second(create_infographic, output_dir, count)
+        print(f"pyplot renderer:   {before:6.2f} renders/s")
+        print(f"template renderer: {after:6.2f} renders/s ({after / before:.2f}x)")
+
+        # Only the Figure-based renderer may be driven from several threads
+        threaded = renders_per_second(create_infographic, output_dir, count, 4)
+        print(f"template renderer, 4 threads: {threaded:6.2f} renders/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
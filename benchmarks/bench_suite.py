@@ -0,0 +1,281 @@
+"""Ingest pipeline benchmarks with JSON output.
+
+    python -m benchmarks.bench_suite --output results.json
+    python -m benchmarks.bench_suite --sizes 1000 1000000 --trips 10 100000
+
+Each record holds the best wall time over --repeat runs and the peak
+traced allocation (tracemalloc, one extra untimed run). With --baseline the
+run is compared against an earlier result file and exits with status 1 if
+any benchmark got slower or hungrier than --threshold allows.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from collections.abc import Callable
+from datetime import date, timedelta
+from functools import partial
+from typing import Any
+
+import numpy as np
+
+from benchmarks.synthetic import write_gpx
+from bot.models.trip import Trip
+from bot.services.calculator import calculate_metrics
+from bot.services.gpx_parser import parse_gpx
+from bot.services.graphics import create_infographic
+from bot.services.series import build_series, pack_series
+from bot.services.track_store import open_track, write_track
+from database.db import db
+
+# (name, with_elevation, with_time, segments)
+TRACK_VARIANTS = (
+    ("full", True, True, 1),
+    ("no_elevation", False, True, 1),
+    ("no_time", True, False, 1),
+    ("segments", True, True, 10),
+)
+
+
+def measure(func: Callable[[], Any], repeat: int) -> dict[str, Any]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    # Separate run: tracing allocations slows the code down several times
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(timings), "repeat": repeat, "peak_bytes": peak}
+
+
+def bench_tracks(workdir: str, sizes: list[int], repeat: int) -> list[dict]:
+    results = []
+    for n in sizes:
+        for variant, with_elevation, with_time, segments in TRACK_VARIANTS:
+            gpx_path = os.path.join(workdir, f"track_{n}_{variant}.gpx")
+            write_gpx(gpx_path, n, with_elevation, with_time, segments)
+            params = {
+                "points": n,
+                "variant": variant,
+                "gpx_bytes": os.path.getsize(gpx_path),
+            }
+
+            points = parse_gpx(gpx_path)["points"]
+            trk_path = os.path.join(workdir, f"track_{n}_{variant}.trk")
+            write_track(points.columns, trk_path)
+            params["trk_bytes"] = os.path.getsize(trk_path)
+
+            cases = {
+                "parse_gpx": lambda: parse_gpx(gpx_path),
+                "calculate_metrics": lambda: calculate_metrics(points),
+                "build_series": lambda: build_series(points),
+                "write_track": lambda: write_track(points.columns, trk_path),
+                "open_track+metrics": lambda: calculate_metrics(open_track(trk_path)),
+            }
+            for name, func in cases.items():
+                results.append(
+                    {"bench": name, "params": params, **measure(func, repeat)}
+                )
+                _progress(results[-1])
+            os.remove(gpx_path)
+            os.remove(trk_path)
+    return results
+
+
+def bench_render(workdir: str, repeat: int) -> list[dict]:
+    warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+    results = []
+    gpx_path = write_gpx(os.path.join(workdir, "render.gpx"), 10_000)
+    for with_elevation in (True, False):
+        points = parse_gpx(gpx_path)["points"]
+        metrics = calculate_metrics(points)
+        if not with_elevation:
+            metrics.update(min_elevation=None, max_elevation=None)
+        series = build_series(points)
+        output_path = os.path.join(workdir, "render.png")
+        # The first render builds the figure template; keep it out of timings
+        create_infographic(metrics, output_path, series)
+
+        result = measure(
+            lambda: create_infographic(metrics, output_path, series), repeat
+        )
+        params = {"elevation": with_elevation, "series_points": len(series["speeds"])}
+        results.append({"bench": "create_infographic", "params": params, **result})
+        _progress(results[-1])
+    return results
+
+
+def seed_database(db_path: str, trips: int, seed: int = 0):
+    # Points the model layer at a fresh database and fills it with trips spread
+    # over the last few years (several on some days) and media on every fifth
+    db.close()
+    db.db_path = db_path
+    db.init_db()
+
+    rng = random.Random(seed)
+    packed = pack_series(
+        {
+            key: np.zeros(0)
+            for key in ("speed_hours", "speeds", "elevation_km", "elevations")
+        }
+    )
+    today = date.today()
+    rows = []
+    for _ in range(trips):
+        distance = rng.uniform(2_000, 40_000)
+        duration = int(distance / rng.uniform(1.2, 2.5))
+        rows.append(
+            {
+                "trip_date": today - timedelta(days=rng.randrange(5 * 365)),
+                "distance": distance,
+                "duration": duration,
+                "avg_speed": distance / duration * 3.6,
+                "max_speed": rng.uniform(8, 15),
+                "min_elevation": rng.uniform(100, 150),
+                "max_elevation": rng.uniform(150, 200),
+                "elevation_gain": rng.uniform(0, 100),
+            }
+        )
+    trip_ids = Trip.create_many(rows, [packed] * trips)
+    with db.transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO trip_media (trip_id, file_path, media_type)
+            VALUES (?, ?, ?)
+        """,
+            (
+                (trip_id, f"media_{trip_id}_{i}.jpg", "photo" if i % 3 else "video")
+                for trip_id in trip_ids[::5]
+                for i in range(4)
+            ),
+        )
+        conn.execute("ANALYZE")
+
+
+def bench_queries(workdir: str, trip_counts: list[int], repeat: int) -> list[dict]:
+    results = []
+    for trips in trip_counts:
+        db_path = os.path.join(workdir, f"trips_{trips}.db")
+        seed_database(db_path, trips)
+
+        middle = Trip.get_page(None, trips // 2 or 1)[-1]
+        cursor = (str(middle.trip_date), middle.id)
+        since = date.today() - timedelta(days=365)
+        cases = {
+            "count_all": Trip.count_all,
+            "get_last": Trip.get_last,
+            "get_by_id": lambda: Trip.get_by_id(middle.id),
+            "get_page_first": lambda: Trip.get_page(None, 10),
+            "get_page_middle": lambda: Trip.get_page(cursor, 10),
+            "get_page_with_media_summary": partial(
+                Trip.get_page_with_media_summary, cursor, 10
+            ),
+            "get_media_summary": middle.get_media_summary,
+            "get_daily_stats_year": lambda: Trip.get_daily_stats(since),
+            "get_paginated_middle": lambda: Trip.get_paginated(trips // 20 or 1, 10),
+        }
+        for name, func in cases.items():
+            result = measure(func, repeat)
+            results.append(
+                {"bench": f"Trip.{name}", "params": {"trips": trips}, **result}
+            )
+            _progress(results[-1])
+        db.close()
+    return results
+
+
+def _progress(result: dict):
+    print(
+        f"{result['bench']:<32} {json.dumps(result['params']):<70} "
+        f"{result['seconds'] * 1000:10.2f} ms {result['peak_bytes'] / 2**20:8.1f} MiB",
+        file=sys.stderr,
+    )
+
+
+def compare(baseline: dict, results: list[dict], threshold: float) -> list[str]:
+    # Records are matched on name and parameters; new benchmarks are skipped
+    previous = {
+        (r["bench"], json.dumps(r["params"], sort_keys=True)): r
+        for r in baseline["results"]
+    }
+    regressions = []
+    for result in results:
+        old = previous.get(
+            (result["bench"], json.dumps(result["params"], sort_keys=True))
+        )
+        if old is None:
+            continue
+        for field in ("seconds", "peak_bytes"):
+            # Ignore noise on sub-millisecond timings and tiny allocations
+            floor = 1e-3 if field == "seconds" else 2**20
+            if result[field] > max(old[field], floor) * threshold:
+                regressions.append(
+                    f"{result['bench']} {json.dumps(result['params'])}: {field} "
+                    f"{old[field]:.4g} -> {result[field]:.4g}"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--trips", type=int, nargs="+", default=[10, 1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", choices=("tracks", "render", "queries"), nargs="+")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON output to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args(argv)
+    only = set(args.only or ("tracks", "render", "queries"))
+
+    started = time.time()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        if "tracks" in only:
+            results += bench_tracks(workdir, args.sizes, args.repeat)
+        if "render" in only:
+            results += bench_render(workdir, args.repeat)
+        if "queries" in only:
+            results += bench_queries(workdir, args.trips, args.repeat)
+
+    report = {
+        "started_at": started,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
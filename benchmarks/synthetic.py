@@ -0,0 +1,93 @@
+import math
+import random
+from collections.abc import Iterator
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from bot.services.gpx_parser import TrackColumns, TrackPoints
+
+
+def generate_points(
+    n: int,
+    with_elevation: bool = True,
+    with_time: bool = True,
+    seed: int = 0,
+    start: datetime | None = None,
+) -> list[dict[str, Any]]:
+    return list(iter_points(n, with_elevation, with_time, seed, start))
+
+
+def iter_points(
+    n: int,
+    with_elevation: bool = True,
+    with_time: bool = True,
+    seed: int = 0,
+    start: datetime | None = None,
+) -> Iterator[dict[str, Any]]:
+    # Random walk downstream at ~8 km/h with 1 s logging and occasional stops
+    rng = random.Random(seed)
+    start = start or datetime(2024, 6, 1, 8, 0, tzinfo=UTC)
+    lat, lon, elevation = 55.75, 37.62, 150.0
+    heading = rng.uniform(0, 2 * math.pi)
+
+    for i in range(n):
+        heading += rng.gauss(0, 0.05)
+        step = 0.0 if rng.random() < 0.02 else rng.gauss(2.2, 0.4)
+        lat += step * math.cos(heading) / 111_320
+        lon += step * math.sin(heading) / (111_320 * math.cos(math.radians(lat)))
+        elevation += rng.gauss(-0.01, 0.3)
+        yield {
+            "lat": lat,
+            "lon": lon,
+            "elevation": round(elevation, 1) if with_elevation else None,
+            "time": start + timedelta(seconds=i) if with_time else None,
+        }
+
+
+def write_gpx(
+    path: str,
+    n: int,
+    with_elevation: bool = True,
+    with_time: bool = True,
+    segments: int = 1,
+    seed: int = 0,
+) -> str:
+    # Streams the file, so million-point tracks don't have to fit in memory.
+    # The layout follows what GPS loggers export: GPX 1.1 namespace, metadata,
+    # 7-decimal coordinates, UTC "Z" timestamps, the track split into segments
+    # (pauses) of equal length.
+    per_segment = max(1, math.ceil(n / max(1, segments)))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gpx version="1.1" creator="benchmarks.synthetic" '
+            'xmlns="http://www.topografix.com/GPX/1/1">\n'
+            "  <metadata><name>Synthetic</name></metadata>\n"
+            "  <trk>\n    <name>Synthetic</name>\n    <trkseg>\n"
+        )
+        for i, point in enumerate(iter_points(n, with_elevation, with_time, seed)):
+            if i and i % per_segment == 0:
+                f.write("    </trkseg>\n    <trkseg>\n")
+            f.write(f'      <trkpt lat="{point["lat"]:.7f}" lon="{point["lon"]:.7f}">')
+            if point["elevation"] is not None:
+                f.write(f"<ele>{point['elevation']:.1f}</ele>")
+            if point["time"] is not None:
+                f.write(f"<time>{point['time']:%Y-%m-%dT%H:%M:%SZ}</time>")
+            f.write("</trkpt>\n")
+        f.write("    </trkseg>\n  </trk>\n</gpx>\n")
+    return path
+
+
+def to_track_points(points: list[dict[str, Any]]) -> TrackPoints:
+    # Same columnar form parse_gpx returns
+    columns = TrackColumns(name="Synthetic")
+    for point in points:
+        elevation = point["elevation"]
+        time = point["time"]
+        columns.append(
+            point["lat"],
+            point["lon"],
+            math.nan if elevation is None else elevation,
+            math.nan if time is None else time.timestamp(),
+        )
+    return TrackPoints(columns)
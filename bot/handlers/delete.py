@@ -7,9 +7,11 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from bot.models.trip import Trip
-from config import ADMIN_ID, GRAPHICS_DIR
+from bot.services.blob_store import discard_gpx
+from bot.services.render_cache import render_cache
+from config import ADMIN_ID
 
-router = Router()
+router = Router(name="delete")
 logger = logging.getLogger(__name__)
 
 
@@ -23,7 +25,7 @@ async def trip_confirm_del_callback(callback: types.CallbackQuery, state: FSMCon
         return
 
     trip_id = int(callback.data.split("_")[2])
-    trip = Trip.get_by_id(trip_id)
+    trip = await Trip.aget_by_id(trip_id)
 
     if not trip:
         await callback.answer("Сплав не найден.")
@@ -60,21 +62,20 @@ async def trip_delete_callback(callback: types.CallbackQuery, state: FSMContext)
         return
 
     trip_id = int(callback.data.split("_")[3])
-    trip = Trip.get_by_id(trip_id)
+    trip = await Trip.aget_by_id(trip_id)
 
     if trip:
-        trip.delete()
+        # Media files shared with other trips stay on disk
+        orphaned = await trip.adelete()
 
-        if trip.gpx_path and os.path.exists(trip.gpx_path):
-            os.remove(trip.gpx_path)
+        if trip.gpx_path:
+            discard_gpx(trip.gpx_path)
 
-        graphic_path = os.path.join(GRAPHICS_DIR, f"trip_{trip.trip_date}.png")
-        if os.path.exists(graphic_path):
-            os.remove(graphic_path)
+        await render_cache.invalidate(trip.id)
 
-        for media in trip.get_media():
-            if os.path.exists(media.file_path):
-                os.remove(media.file_path)
+        for file_path in orphaned:
+            if os.path.exists(file_path):
+                os.remove(file_path)
 
     await state.clear()
 
@@ -6,10 +6,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ContentType, InlineKeyboardButton, InlineKeyboardMarkup
 
+from bot.handlers.media import save_media
 from bot.models.trip import Trip
-from config import ADMIN_ID, MEDIA_DIR
+from config import ADMIN_ID
 
-router = Router()
+router = Router(name="edit")
 logger = logging.getLogger(__name__)
 
 
@@ -40,7 +41,7 @@ async def handle_add_media(message: types.Message, state: FSMContext):
 
     data = await state.get_data()
     trip_id = data.get("editing_trip_id")
-    trip = Trip.get_by_id(trip_id)
+    trip = await Trip.aget_by_id(trip_id)
 
     if not trip:
         await message.answer("Сплав не найден.")
@@ -48,28 +49,20 @@ async def handle_add_media(message: types.Message, state: FSMContext):
         return
 
     try:
-        if message.photo:
-            media_type = "photo"
-            file = await message.bot.get_file(message.photo[-1].file_id)
-        else:
-            media_type = "video"
-            file = await message.bot.get_file(message.video.file_id)
-
-        file_name = f"trip_{trip.id}_{media_type}_{os.path.basename(file.file_path)}"
-        file_path = os.path.join(MEDIA_DIR, file_name)
-        await message.bot.download_file(file.file_path, file_path)
-
-        trip.add_media(file_path, media_type)
+        media = await save_media(message, trip)
 
         await state.clear()
-        await message.answer("✅ Медиа добавлено!")
+        if media is None:
+            await message.answer("Это медиа уже добавлено к сплаву.")
+        else:
+            await message.answer("✅ Медиа добавлено!")
 
         from bot.handlers.view import show_trip_details
 
         await show_trip_details(message, trip)
 
     except Exception as e:
-        logger.error(f"Error adding media: {e}")
+        logger.error("Error adding media: %s", e)
         await message.answer(f"Ошибка: {e}")
         await state.clear()
 
@@ -80,13 +73,13 @@ async def trip_delmedia_callback(callback: types.CallbackQuery, state: FSMContex
         return
 
     trip_id = int(callback.data.split("_")[2])
-    trip = Trip.get_by_id(trip_id)
+    trip = await Trip.aget_by_id(trip_id)
 
     if not trip:
         await callback.answer("Сплав не найден.")
         return
 
-    media_list = trip.get_media()
+    media_list = await trip.aget_media()
 
     if not media_list:
         await callback.answer("Нет медиа для удаления.")
@@ -126,10 +119,12 @@ async def media_delete_callback(callback: types.CallbackQuery, state: FSMContext
     media_id = int(callback.data.split("_")[2])
     data = await state.get_data()
     trip_id = data.get("viewing_trip_id")
-    trip = Trip.get_by_id(trip_id)
+    trip = await Trip.aget_by_id(trip_id)
 
     if trip:
-        trip.remove_media(media_id)
+        for file_path in await trip.aremove_media(media_id):
+            if os.path.exists(file_path):
+                os.remove(file_path)
 
     await state.clear()
 
@@ -9,8 +9,9 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from bot.models.trip import Trip
 from config import ADMIN_ID
+from database.db import db
 
-router = Router()
+router = Router(name="list")
 logger = logging.getLogger(__name__)
 
 
@@ -27,32 +28,55 @@ async def cmd_list(message: types.Message, state: FSMContext):
     await show_trips_page(message, state, page=1)
 
 
-async def show_trips_page(message: types.Message, state: FSMContext, page: int):
+# Short direction codes keep callback data under Telegram's 64-byte limit
+DIRECTIONS = {"n": "next", "p": "prev", "f": "from"}
+
+
+def page_callback(page: int, direction: str, trip: Trip) -> str:
+    # trip_page_{page}_{direction}_{trip_date}_{id}: page is only displayed,
+    # the (trip_date, id) cursor is what selects the rows
+    return f"trip_page_{page}_{direction}_{trip.trip_date.isoformat()}_{trip.id}"
+
+
+async def show_trips_page(
+    message: types.Message,
+    state: FSMContext,
+    page: int,
+    cursor: tuple[str, int] | None = None,
+    direction: str = "next",
+):
     per_page = 5
-    total_trips = Trip.count_all()
+    # Count and page (with media counts) in one hop: a constant number of
+    # queries however many trips or media items there are
+    total_trips, page_rows = await db.batch(
+        Trip.count_all,
+        lambda: Trip.get_page_with_media_summary(cursor, per_page, direction),
+    )
     total_pages = math.ceil(total_trips / per_page) if total_trips > 0 else 1
 
-    if page < 1:
+    if page < 1 or cursor is None:
         page = 1
     elif page > total_pages:
         page = total_pages
 
-    trips = Trip.get_paginated(page, per_page)
+    if not page_rows and cursor is not None:
+        # The cursor points past trips deleted since the button was sent
+        page = 1
+        page_rows = await Trip.aget_page_with_media_summary(None, per_page)
 
-    if not trips:
+    if not page_rows:
         await message.answer("Сплавов пока нет. Отправь GPX файл для первого сплава!")
         return
 
     main_text = f"📋 Ваши сплавы (стр. {page}/{total_pages}):\n\n"
     trip_buttons = []
 
-    for trip in trips:
-        media_count = len(trip.get_media())
+    trips = [trip for trip, _ in page_rows]
+    for trip, media in page_rows:
+        media_count = media.total
         media_emoji = "📷" * min(media_count, 3) if media_count else ""
         media_emoji += "..." if media_count > 3 else ""
-        media_emoji += (
-            "🎬" if any(m.media_type == "video" for m in trip.get_media()) else ""
-        )
+        media_emoji += "🎬" if media.video_count else ""
 
         trip_buttons.append(
             [
@@ -68,18 +92,23 @@ async def show_trips_page(message: types.Message, state: FSMContext, page: int):
     nav_buttons = []
     if page > 1:
         nav_buttons.append(
-            InlineKeyboardButton(text="◀", callback_data=f"trip_page_{page-1}")
+            InlineKeyboardButton(
+                text="◀", callback_data=page_callback(page - 1, "p", trips[0])
+            )
         )
 
     nav_buttons.append(
         InlineKeyboardButton(
-            text=f"{page}/{total_pages}", callback_data=f"trip_page_{page}"
+            text=f"{page}/{total_pages}",
+            callback_data=page_callback(page, "f", trips[0]),
         )
     )
 
-    if page < total_pages:
+    if page < total_pages and len(trips) == per_page:
         nav_buttons.append(
-            InlineKeyboardButton(text="▶", callback_data=f"trip_page_{page+1}")
+            InlineKeyboardButton(
+                text="▶", callback_data=page_callback(page + 1, "n", trips[-1])
+            )
         )
 
     keyboard.inline_keyboard.append(nav_buttons)
@@ -94,9 +123,16 @@ async def trip_page_callback(callback: types.CallbackQuery, state: FSMContext):
     if callback.from_user.id != ADMIN_ID:
         return
 
-    page = int(callback.data.split("_")[2])
+    parts = callback.data.split("_")
+    page = int(parts[2])
+    cursor = None
+    direction = "next"
+    if len(parts) == 6:
+        direction = DIRECTIONS.get(parts[3], "next")
+        cursor = (parts[4], int(parts[5]))
+
     await callback.message.delete()
-    await show_trips_page(callback.message, state, page)
+    await show_trips_page(callback.message, state, page, cursor, direction)
     await callback.answer()
 
 
@@ -106,7 +142,7 @@ async def trip_view_callback(callback: types.CallbackQuery, state: FSMContext):
         return
 
     trip_id = int(callback.data.split("_")[2])
-    trip = Trip.get_by_id(trip_id)
+    trip = await Trip.aget_by_id(trip_id)
 
     if trip:
         # Local import to prevent circular dependency (list -> view -> list)
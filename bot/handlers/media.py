@@ -1,13 +1,14 @@
 import logging
-import os
 
 from aiogram import F, Router, types
 from aiogram.types import ContentType
 
-from bot.models.trip import Trip
+from bot.models.trip import Media, Trip
+from bot.services.blob_store import content_path, discard, download_hashed, store
+from bot.services.media_sender import send_media_albums
 from config import ADMIN_ID, MEDIA_DIR
 
-router = Router()
+router = Router(name="media")
 logger = logging.getLogger(__name__)
 
 
@@ -16,35 +17,43 @@ async def handle_media(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
 
-    last_trip = Trip.get_last()
+    last_trip = await Trip.aget_last()
     if not last_trip:
         await message.answer("Сначала добавь сплав (отправь GPX файл).")
         return
 
     try:
-        if message.photo:
-            media_type = "photo"
-            file = await message.bot.get_file(message.photo[-1].file_id)
-        else:
-            media_type = "video"
-            file = await message.bot.get_file(message.video.file_id)
-
-        file_name = (
-            f"trip_{last_trip.id}_{media_type}{os.path.basename(file.file_path)}"
-        )
-        file_path = os.path.join(MEDIA_DIR, file_name)
-        await message.bot.download_file(file.file_path, file_path)
-
-        last_trip.add_media(file_path, media_type)
+        media = await save_media(message, last_trip)
+        if media is None:
+            await message.answer("Это медиа уже добавлено к последнему сплаву.")
+            return
 
-        emoji = "📷" if media_type == "photo" else "🎬"
+        emoji = "📷" if media.media_type == "photo" else "🎬"
         await message.answer(f"{emoji} Медиа добавлено к последнему сплаву!")
 
     except Exception as e:
-        logger.error(f"Error saving media: {e}")
+        logger.error("Error saving media: %s", e)
         await message.answer(f"Ошибка при сохранении медиа: {e}")
 
 
+async def save_media(message: types.Message, trip: Trip) -> Media | None:
+    # Media files are stored once per content hash (MEDIA_DIR/<sha256>.<ext>)
+    # and shared between trips; returns None if this trip already has the file
+    if message.photo:
+        media_type = "photo"
+        file_id = message.photo[-1].file_id
+    else:
+        media_type = "video"
+        file_id = message.video.file_id
+
+    digest, tmp_path, suffix = await download_hashed(message.bot, file_id, MEDIA_DIR)
+    if await trip.aget_media_by_sha256(digest):
+        discard(tmp_path)
+        return None
+    file_path = store(tmp_path, content_path(MEDIA_DIR, digest, suffix))
+    return await trip.aadd_media(file_path, media_type, file_id, digest)
+
+
 @router.callback_query(F.data.startswith("trip_viewmedia_"))
 async def view_media_callback(callback: types.CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
@@ -52,31 +61,21 @@ async def view_media_callback(callback: types.CallbackQuery):
         return
 
     trip_id = int(callback.data.split("_")[2])
-    trip = Trip.get_by_id(trip_id)
+    trip = await Trip.aget_by_id(trip_id)
 
     if not trip:
         await callback.answer("Сплав не найден.")
         return
 
-    media_list = trip.get_media()
+    media_list = await trip.aget_media()
     if not media_list:
         await callback.answer("У этого сплава нет медиа.")
         return
 
     await callback.answer("Загружаю медиа...")  # Acknowledge immediately
 
-    for media_item in media_list:
-        try:
-            if media_item.media_type == "photo":
-                await callback.message.answer_photo(
-                    types.FSInputFile(media_item.file_path)
-                )
-            elif media_item.media_type == "video":
-                await callback.message.answer_video(
-                    types.FSInputFile(media_item.file_path)
-                )
-        except Exception as e:
-            logger.error(f"Error sending media {media_item.file_path}: {e}")
-            await callback.message.answer(
-                f"Ошибка при отправке медиа {media_item.file_path}: {e}"
-            )
+    failed = await send_media_albums(callback.bot, callback.message.chat.id, media_list)
+    if failed:
+        await callback.message.answer(
+            f"Не удалось отправить {failed} из {len(media_list)} медиа."
+        )
@@ -0,0 +1,43 @@
+from aiogram import Router, types
+from aiogram.filters import Command
+
+from bot.services.profiling import TARGETS, profiler
+from config import ADMIN_ID, PROFILES_DIR
+
+router = Router(name="profile")
+
+USAGE = (
+    "Использование:\n"
+    "/profile N - профилировать следующие N обработок GPX\n"
+    "/profile N handlers - следующие N вызовов хэндлеров\n"
+    "/profile off - выключить"
+)
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    args = message.text.split()[1:]
+    if not args:
+        status = ", ".join(f"{t}: {n}" for t, n in profiler.remaining.items())
+        await message.answer(f"🔬 Осталось профилировать: {status}\n\n{USAGE}")
+        return
+
+    if args[0] == "off":
+        profiler.disarm()
+        await message.answer("🔬 Профилирование выключено.")
+        return
+
+    target = args[1] if len(args) > 1 else "jobs"
+    if not args[0].isdigit() or target not in TARGETS:
+        await message.answer(USAGE)
+        return
+
+    profiler.arm(target, int(args[0]), message.chat.id)
+    what = "обработок GPX" if target == "jobs" else "вызовов хэндлеров"
+    await message.answer(
+        f"🔬 Профилирую следующие {args[0]} {what}. "
+        f"Файлы .pstats и .collapsed появятся в {PROFILES_DIR}."
+    )
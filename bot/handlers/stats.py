@@ -6,7 +6,7 @@ from aiogram.filters import Command
 from bot.models.trip import Trip
 from config import ADMIN_ID
 
-router = Router()
+router = Router(name="stats")
 
 
 @router.message(Command("stats"))
@@ -34,23 +34,26 @@ async def cmd_stats(message: types.Message):
         start_date = datetime.min.date()
         title = "📊 Общая статистика"
 
-    trips = [t for t in Trip.get_all() if t.trip_date >= start_date]
+    days = await Trip.aget_daily_stats(start_date)
 
-    if not trips:
+    if not days:
         text = f"{title}\n\nСплавов за этот период нет."
     else:
-        total_distance = sum(t.distance or 0 for t in trips) / 1000
-        total_duration = sum(t.duration or 0 for t in trips)
+        trip_count = sum(d.trip_count for d in days)
+        total_distance = sum(d.distance_sum for d in days) / 1000
+        total_duration = sum(d.duration_sum for d in days)
 
-        speeds = [t.avg_speed for t in trips if t.avg_speed is not None]
-        avg_speed = (sum(speeds) / len(speeds)) if speeds else 0.0
+        speed_count = sum(d.avg_speed_count for d in days)
+        avg_speed = (
+            sum(d.avg_speed_sum for d in days) / speed_count if speed_count else 0.0
+        )
 
-        max_speeds = [t.max_speed for t in trips if t.max_speed is not None]
+        max_speeds = [d.max_speed for d in days if d.max_speed is not None]
         max_speed = max(max_speeds) if max_speeds else 0.0
 
         text = (
             f"{title}\n\n"
-            f"📅 Сплавов: {len(trips)}\n"
+            f"📅 Сплавов: {trip_count}\n"
             f"📍 Общее расстояние: {total_distance:.1f} км\n"
             f"⏱️ Общее время: {total_duration // 3600}ч "
             f"{(total_duration % 3600) // 60}м\n"
@@ -58,18 +61,28 @@ async def cmd_stats(message: types.Message):
             f"🚀 Максимальная скорость: {max_speed:.1f} км/ч\n\n"
         )
 
-        for trip in trips:
-            text += f"• {trip.trip_date}: {(trip.distance or 0) / 1000:.1f} км\n"
+        for day in days:
+            text += f"• {day.trip_date}: {day.distance_sum / 1000:.1f} км"
+            text += f" (×{day.trip_count})\n" if day.trip_count > 1 else "\n"
 
     await message.answer(text)
 
 
+@router.message(Command("rebuild_stats"))
+async def cmd_rebuild_stats(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    days = await Trip.arebuild_daily_rollup()
+    await message.answer(f"🔄 Статистика пересчитана: {days} дн.")
+
+
 @router.message(Command("last"))
 async def cmd_last(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
 
-    trip = Trip.get_last()
+    trip = await Trip.aget_last()
 
     if not trip:
         await message.answer("Сплавов пока нет.")
@@ -1,18 +1,17 @@
 import logging
-import os
-import traceback
+import time
 
 from aiogram import F, Router, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import ContentType
 
-from bot.models.trip import Trip
-from bot.services.calculator import calculate_metrics
-from bot.services.gpx_parser import parse_gpx
-from bot.services.graphics import create_infographic
-from config import ADMIN_ID, GRAPHICS_DIR, TRACKS_DIR
+from bot.services.archive_import import ImportResult, import_archive, is_archive
+from bot.services.blob_store import discard, download_hashed
+from bot.services.ingest_queue import ingest_queue
+from config import ADMIN_ID, TRACKS_DIR
 
-router = Router()
+router = Router(name="track")
 logger = logging.getLogger(__name__)
 
 
@@ -27,8 +26,11 @@ async def cmd_start(message: types.Message):
         "/start - это сообщение\n"
         "/list - список всех сплавов\n"
         "/stats [day|week|month|year|all] - статистика\n"
-        "/last - последний сплав\n\n"
-        "Просто отправь GPX файл, чтобы добавить новый сплав!"
+        "/last - последний сплав\n"
+        "/rebuild_stats - пересчитать статистику\n"
+        "/profile N - профилировать следующие N обработок GPX\n\n"
+        "Просто отправь GPX файл, чтобы добавить новый сплав, "
+        "или архив (.zip, .tar.gz) с GPX файлами для импорта истории!"
     )
 
 
@@ -38,77 +40,78 @@ async def handle_gpx_file(message: types.Message):
         return
 
     document = message.document
+    file_name = document.file_name or ""
 
-    if not document.file_name.lower().endswith(".gpx"):
-        await message.answer("Пожалуйста, отправь GPX файл.")
+    if is_archive(file_name):
+        await handle_archive(message)
         return
 
-    await message.answer("Обрабатываю GPX файл...")
+    if not file_name.lower().endswith(".gpx"):
+        await message.answer("Пожалуйста, отправь GPX файл или архив с GPX файлами.")
+        return
 
-    try:
-        file_path = await save_gpx_file(message)
-        gpx_data = parse_gpx(file_path)
-        logger.info(f"Parsed GPX data: {gpx_data}")
-
-        metrics = calculate_metrics(gpx_data["points"])
-        logger.info(f"Calculated metrics: {metrics}")
-
-        graphic_path = os.path.join(GRAPHICS_DIR, f"trip_{metrics['trip_date']}.png")
-        create_infographic(metrics, graphic_path)
-
-        Trip.create(
-            trip_date=metrics["trip_date"],
-            distance=metrics["distance"],
-            duration=metrics["duration"],
-            avg_speed=metrics["avg_speed"],
-            max_speed=metrics["max_speed"],
-            min_elevation=metrics["min_elevation"],
-            max_elevation=metrics["max_elevation"],
-            elevation_gain=metrics["elevation_gain"],
-            gpx_path=file_path,
-        )
+    # Processed by the ingest queue, which edits this message as it goes;
+    # the handler returns right away
+    status = await message.answer("⏳ GPX файл в очереди на обработку...")
+    await ingest_queue.enqueue(
+        message.chat.id, status.message_id, document.file_id, file_name
+    )
 
-        caption = (
-            f"✅ Сплав добавлен!\n\n"
-            f"📊 {metrics['trip_date']} | {metrics['distance'] / 1000:.1f} км\n"
-        )
 
-        if (
-            metrics.get("avg_speed") is not None
-            and metrics.get("max_speed") is not None
-        ):
-            caption += (
-                f"⚡ {metrics['avg_speed']:.1f} км/ч (средняя), "
-                f"{metrics['max_speed']:.1f} км/ч (макс)\n"
-            )
-        else:
-            caption += "⚡ Скорость: нет данных\n"
-
-        if (
-            metrics.get("min_elevation") is not None
-            and metrics.get("max_elevation") is not None
-        ):
-            caption += (
-                f"⛰️ {metrics['min_elevation']:.0f}-{metrics['max_elevation']:.0f} м, "
-                f"набор: {metrics['elevation_gain']:.0f} м\n"
-            )
-        else:
-            caption += "⛰️ Высота: нет данных\n"
-
-        caption += (
-            f"⏱️ {metrics['duration'] // 3600}ч {(metrics['duration'] % 3600) // 60}м"
-        )
+# Minimum seconds between edits of the import progress message
+PROGRESS_INTERVAL = 2.0
+REPORT_MAX_REJECTED = 20
+
+
+async def handle_archive(message: types.Message):
+    status = await message.answer("📦 Загружаю архив...")
+    last_edit = 0.0
 
-        await message.answer_photo(types.FSInputFile(graphic_path), caption=caption)
+    async def edit_status(text: str):
+        try:
+            await status.edit_text(text)
+        except TelegramBadRequest:
+            # "message is not modified" and the like are not worth failing for
+            pass
 
+    async def progress(done: int, total: int):
+        nonlocal last_edit
+        now = time.monotonic()
+        if done < total and now - last_edit < PROGRESS_INTERVAL:
+            return
+        last_edit = now
+        await edit_status(f"📦 Импорт: обработано {done} из {total} треков...")
+
+    archive_path = None
+    try:
+        _, archive_path, _ = await download_hashed(
+            message.bot, message.document.file_id, TRACKS_DIR
+        )
+        await edit_status("📦 Распаковываю архив...")
+        result = await import_archive(archive_path, progress)
     except Exception as e:
-        logger.error(f"Error processing GPX: {e}\n{traceback.format_exc()}")
-        await message.answer(f"Ошибка при обработке GPX файла: {e}")
+        logger.exception("Error importing archive %s", message.document.file_name)
+        await edit_status(f"Ошибка при импорте архива: {e}")
+        return
+    finally:
+        if archive_path:
+            discard(archive_path)
 
+    await edit_status(format_import_report(result))
 
-async def save_gpx_file(message: types.Message) -> str:
-    document = message.document
-    file = await message.bot.get_file(document.file_id)
-    file_path = os.path.join(TRACKS_DIR, document.file_name)
-    await message.bot.download_file(file.file_path, file_path)
-    return file_path
+
+def format_import_report(result: ImportResult) -> str:
+    elapsed = max(result.elapsed, 1e-3)
+    text = (
+        f"✅ Импорт завершён за {result.elapsed:.1f} с\n\n"
+        f"Добавлено сплавов: {len(result.trip_ids)} из {result.files} файлов\n"
+        f"Скорость: {result.files / elapsed:.1f} файлов/с, "
+        f"{result.bytes / elapsed / 1024 / 1024:.1f} МБ/с"
+    )
+    if result.rejected:
+        text += f"\n\n⚠️ Отклонено: {len(result.rejected)}"
+        for name, reason in result.rejected[:REPORT_MAX_REJECTED]:
+            text += f"\n• {name[-60:]} — {reason[:100]}"
+        if len(result.rejected) > REPORT_MAX_REJECTED:
+            text += f"\n…и ещё {len(result.rejected) - REPORT_MAX_REJECTED}"
+    return text
@@ -1,30 +1,29 @@
 import logging
-import os
 
 from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from bot.models.trip import Trip
-from config import ADMIN_ID, GRAPHICS_DIR
+from bot.services.render_cache import render_cache
+from bot.services.telegram_files import send_cached
+from config import ADMIN_ID
 
-router = Router()
+router = Router(name="view")
 logger = logging.getLogger(__name__)
 
 
 async def show_trip_details(
     message: types.Message, trip: Trip, from_list: bool = False
 ):
-    media = trip.get_media()
+    media = await trip.aget_media_summary()
     media_info = ""
-    if media:
-        photo_count = sum(1 for m in media if m.media_type == "photo")
-        video_count = sum(1 for m in media if m.media_type == "video")
+    if media.total:
         parts = []
-        if photo_count:
-            parts.append(f"📷{photo_count}")
-        if video_count:
-            parts.append(f"🎬{video_count}")
+        if media.photo_count:
+            parts.append(f"📷{media.photo_count}")
+        if media.video_count:
+            parts.append(f"🎬{media.video_count}")
         media_info = " | ".join(parts)
     else:
         media_info = "Нет"
@@ -59,7 +58,7 @@ async def show_trip_details(
         ]
     ]
 
-    if media:  # Conditionally add the view media button
+    if media.total:  # Conditionally add the view media button
         inline_keyboard_rows.insert(
             0,
             [
@@ -79,12 +78,27 @@ async def show_trip_details(
     )
     keyboard = InlineKeyboardMarkup(inline_keyboard=inline_keyboard_rows)
 
-    graphic_path = os.path.join(GRAPHICS_DIR, f"trip_{trip.trip_date}.png")
-    if os.path.exists(graphic_path):
-        await message.answer_photo(
-            types.FSInputFile(graphic_path), caption=text, reply_markup=keyboard
-        )
-    else:
+    graphic_key = render_cache.key_for(trip)
+    graphic_file_id = await trip.aget_graphic_file_id(graphic_key)
+
+    async def graphic_path():
+        try:
+            # Rendered on first view if the image is missing or outdated
+            return await render_cache.get_or_render(trip)
+        except Exception as e:
+            logger.error("Error rendering graphic for trip %d: %s", trip.id, e)
+            return None
+
+    sent, new_file_id = await send_cached(
+        message.answer_photo,
+        graphic_file_id,
+        graphic_path,
+        caption=text,
+        reply_markup=keyboard,
+    )
+    if new_file_id:
+        await trip.aset_graphic_file_id(graphic_key, new_file_id)
+    if sent is None:
         await message.answer(text, reply_markup=keyboard)
 
 
@@ -1,19 +1,47 @@
 import asyncio
 import logging
+import os
+import signal
+import time
+from multiprocessing.synchronize import Event as EventType
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 
 import config
-from bot.handlers import delete, edit, media, stats, track, view
-from bot.handlers import list as list_handler
-
-logging.basicConfig(level=logging.INFO)
+from bot.middlewares.metrics import setup_metrics
+from bot.middlewares.profiling import setup_profiling
+from bot.middlewares.rate_limit import rate_limiter
+from bot.services.fsm_storage import SQLiteStorage
+from bot.services.ingest_queue import ingest_queue
+from bot.services.logs import setup_logging
+from bot.services.metrics import UPDATES_IN_FLIGHT, registry
+from bot.services.profiling import profiler
+from bot.services.worker_pool import ingest_pool
+from bot.startup import prewarm, startup
+from database.db import db
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# In include order; imported in main() so the start-up report can time each
+ROUTER_MODULES = (
+    "track",
+    "media",
+    "list",
+    "view",
+    "edit",
+    "delete",
+    "stats",
+    "profile",
+)
+
+# Start-up work that runs alongside update handling; references are kept so
+# the tasks aren't garbage collected mid-flight
+_background_tasks = set()
+
 
 async def set_bot_commands(bot: Bot):
     commands = [
@@ -21,54 +49,197 @@ async def set_bot_commands(bot: Bot):
         BotCommand(command="/list", description="Список сплавов"),
         BotCommand(command="/stats", description="Статистика"),
         BotCommand(command="/last", description="Последний сплав"),
+        BotCommand(command="/profile", description="Профилирование"),
     ]
     await bot.set_my_commands(commands)
 
 
 async def on_startup(bot: Bot):
     await bot.set_webhook(url=config.WEBHOOK_URL)
-    logger.info(f"Webhook set to {config.WEBHOOK_URL}")
+    logger.info("Webhook set to %s", config.WEBHOOK_URL)
+
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+
+    def done(task: asyncio.Task):
+        _background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Background task failed", exc_info=task.exception())
+
+    task.add_done_callback(done)
+    return task
+
+
+async def on_dispatcher_startup(bot: Bot, worker: int | None = None):
+    logger.info(startup.report())
+    profiler.bot = bot
+    run_in_background(set_bot_commands(bot))
+    # Each process works off the shared ingest queue under its own name, so
+    # a restarted worker resumes the jobs it was running
+    owner = "main" if worker is None else f"worker-{worker}"
+    run_in_background(ingest_queue.start(bot, owner))
+    if config.PREWARM:
+        prewarm()
+        run_in_background(ingest_pool.start())
+
+
+async def on_dispatcher_shutdown():
+    await ingest_queue.stop()
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=registry.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+async def health_handler(request: web.Request) -> web.Response:
+    return web.json_response(
+        {
+            "status": "ok",
+            "worker": request.app["worker"],
+            "pid": os.getpid(),
+            "uptime": round(time.monotonic() - request.app["started"], 1),
+            "updates_in_flight": updates_in_flight(),
+        }
+    )
+
+
+def updates_in_flight() -> int:
+    return int(UPDATES_IN_FLIGHT.values.get((), 0))
+
+
+async def drain(timeout: float):
+    # Webhook updates are handled in background tasks after the request has
+    # been answered, so closing the server alone would cut them off
+    deadline = time.monotonic() + timeout
+    while updates_in_flight() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if updates_in_flight():
+        logger.warning("Stopping with %d updates in flight", updates_in_flight())
+
+
+async def log_metrics(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        lines = registry.summary()
+        if lines:
+            logger.info("Metrics:\n  %s", "\n  ".join(lines))
 
 
 async def main():
-    bot = Bot(token=config.BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    if config.WEBHOOK_URL and config.WEBHOOK_WORKERS > 1:
+        from bot.supervisor import supervise
+
+        await supervise(config.WEBHOOK_WORKERS)
+    else:
+        await serve()
 
-    dp.include_router(track.router)
-    dp.include_router(media.router)
-    dp.include_router(list_handler.router)
-    dp.include_router(view.router)
-    dp.include_router(edit.router)
-    dp.include_router(delete.router)
-    dp.include_router(stats.router)
 
-    await set_bot_commands(bot)
+async def serve(worker: int | None = None, ready: EventType | None = None):
+    # worker/ready are set when running as one of several webhook processes
+    # started by bot.supervisor
+    with startup.step("data directories"):
+        config.ensure_dirs()
+    with startup.step("database migrations"):
+        db.init_db()
 
+    bot = Bot(token=config.BOT_TOKEN)
+    bot.session.middleware(rate_limiter)
+    if worker is None:
+        storage = SQLiteStorage()
+    else:
+        # Another worker may handle this chat's next update: no read cache,
+        # every change goes straight to the table
+        storage = SQLiteStorage(cache_size=0, flush_interval=0)
+    dp = Dispatcher(storage=storage)
+    dp["worker"] = worker
+
+    for name in ROUTER_MODULES:
+        dp.include_router(startup.import_module(f"bot.handlers.{name}").router)
+    setup_metrics(dp)
+    setup_profiling(dp)
+    # Bot commands and the worker pool no longer hold up the first update
+    dp.startup.register(on_dispatcher_startup)
+    dp.shutdown.register(on_dispatcher_shutdown)
+
+    try:
+        await run(bot, dp, worker, ready)
+    finally:
+        ingest_pool.shutdown()
+
+
+async def run(
+    bot: Bot,
+    dp: Dispatcher,
+    worker: int | None = None,
+    ready: EventType | None = None,
+):
     if config.WEBHOOK_URL:
-        # Webhook logic
-        dp.startup.register(on_startup)
+        # Webhook logic; with several workers the supervisor sets the webhook
+        if worker is None:
+            dp.startup.register(on_startup)
 
         app = web.Application()
+        app["worker"] = worker
+        app["started"] = time.monotonic()
         webhook_requests_handler = SimpleRequestHandler(
             dispatcher=dp,
             bot=bot,
         )
         webhook_requests_handler.register(app, path=config.WEBHOOK_PATH)
+        app.router.add_get("/metrics", metrics_handler)
+        app.router.add_get("/health", health_handler)
         setup_application(app, dp, bot=bot)
 
-        # For nginx reverse proxy, listen on a local host
+        # For nginx reverse proxy, listen on a local host. Workers share the
+        # port (SO_REUSEPORT, the kernel spreads connections between them)
+        # and each also listens on its own port for health checks and metrics.
         runner = web.AppRunner(app)
         await runner.setup()
-        site = web.TCPSite(runner, host="localhost", port=8000)
+        sites = [
+            web.TCPSite(
+                runner, host="localhost", port=8000, reuse_port=worker is not None
+            )
+        ]
+        if worker is not None:
+            port = config.WORKER_PORT_BASE + worker
+            sites.append(web.TCPSite(runner, host="localhost", port=port))
+            registry.gauge(
+                "geobot_worker_info", "Webhook worker serving this port", ("worker",)
+            ).set(1, worker=worker)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
 
         logger.info("Starting webhook server on localhost:8000")
-        await site.start()
-        await asyncio.Event().wait()  # Run forever
+        for site in sites:
+            await site.start()
+        if ready is not None:
+            ready.set()
+        await stop.wait()
+
+        # Graceful stop: no new connections, let running updates finish,
+        # then the dispatcher shutdown (which also flushes FSM state)
+        logger.info("Stopping webhook server")
+        for site in sites:
+            await site.stop()
+        await drain(config.WORKER_SHUTDOWN_TIMEOUT)
+        await runner.cleanup()
     else:
         # Polling logic
         logger.info("Starting polling...")
         await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        reporter = asyncio.create_task(log_metrics(config.METRICS_LOG_INTERVAL))
+        try:
+            await dp.start_polling(bot)
+        finally:
+            reporter.cancel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+from bot.services.metrics import (
+    HANDLER_ERRORS,
+    HANDLER_SECONDS,
+    HANDLERS_IN_FLIGHT,
+    UPDATE_ERRORS,
+    UPDATE_SECONDS,
+    UPDATES_IN_FLIGHT,
+)
+
+Handler = Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    # Outer middleware on dp.update: every update, handled or not, from the
+    # moment the dispatcher receives it until all routers are done
+
+    async def __call__(
+        self, handler: Handler, event: Update, data: dict[str, Any]
+    ) -> Any:
+        update_type = event.event_type
+        UPDATES_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.inc(type=update_type)
+            raise
+        finally:
+            UPDATES_IN_FLIGHT.dec()
+            UPDATE_SECONDS.observe(time.perf_counter() - started, type=update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Inner middleware: only runs once filters matched, so it knows which
+    # router and handler the update ended up in
+
+    def __init__(self, router_name: str):
+        self.router_name = router_name
+
+    async def __call__(
+        self, handler: Handler, event: TelegramObject, data: dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "?")
+        HANDLERS_IN_FLIGHT.inc(router=self.router_name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(router=self.router_name, handler=name)
+            raise
+        finally:
+            HANDLERS_IN_FLIGHT.dec(router=self.router_name)
+            HANDLER_SECONDS.observe(
+                time.perf_counter() - started, router=self.router_name, handler=name
+            )
+
+
+def setup_metrics(dp: Dispatcher):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    for router in dp.sub_routers:
+        middleware = HandlerMetricsMiddleware(router.name)
+        router.message.middleware(middleware)
+        router.callback_query.middleware(middleware)
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from bot.services.profiling import Profile, profiler
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    # Inner middleware, so only handlers that actually run use up the budget.
+    # The profile covers the event loop thread while the handler is awaited:
+    # other updates handled meanwhile show up too, work in the db and
+    # ingest threads/processes does not (profile jobs for that).
+
+    async def __call__(
+        self, handler: Handler, event: TelegramObject, data: dict[str, Any]
+    ) -> Any:
+        if Profile.is_active() or not profiler.take("handlers"):
+            return await handler(event, data)
+
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "?")
+        profile = Profile(name)
+        try:
+            with profile:
+                return await handler(event, data)
+        finally:
+            # Also for a handler that raised; that is often the one of interest
+            try:
+                report = await asyncio.to_thread(profile.save)
+            except Exception:
+                logger.exception("Failed to save the profile of %s", name)
+            else:
+                await profiler.publish(report)
+
+
+def setup_profiling(dp: Dispatcher):
+    middleware = ProfilingMiddleware()
+    for router in dp.sub_routers:
+        router.message.middleware(middleware)
+        router.callback_query.middleware(middleware)
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import random
+import time
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, SendMediaGroup, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+import config
+from bot.services.metrics import CallbackMetric, registry
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, cost: float = 1) -> bool:
+        # Waits until `cost` tokens are available; True if the caller had to wait
+        cost = min(cost, self.capacity)
+        waited = False
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self.paused_until - now
+                if delay <= 0 and self.tokens >= cost:
+                    self.tokens -= cost
+                    return waited
+                if delay <= 0:
+                    delay = (cost - self.tokens) / self.rate
+                waited = True
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        # Telegram asked us to back off: hold every caller, not just the one
+        # that got the 429
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    @property
+    def idle(self) -> bool:
+        return self.tokens >= self.capacity and time.monotonic() >= self.paused_until
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    # Session middleware: every Bot API call takes a token from the global
+    # bucket and, if it targets a chat, from that chat's bucket. 429 responses
+    # pause the bucket for retry_after (plus jitter) and the call is retried.
+
+    def __init__(
+        self,
+        chat_rate: float,
+        global_rate: float,
+        max_retries: int,
+        chat_burst: float = 3,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        self.counters = {"requests": 0, "throttled": 0, "retried": 0, "failed": 0}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket | None:
+        if not isinstance(chat_id, int):
+            # No chat (e.g. answerCallbackQuery) or a @channel username
+            return None
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 1000:
+                self.chat_buckets = {
+                    k: v for k, v in self.chat_buckets.items() if not v.idle
+                }
+            bucket = self.chat_buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst
+            )
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        self.counters["requests"] += 1
+        chat_bucket = self._chat_bucket(getattr(method, "chat_id", None))
+        # Every item of an album counts as a message towards the limits
+        cost = len(method.media) if isinstance(method, SendMediaGroup) else 1
+
+        attempt = 0
+        while True:
+            throttled = await self.global_bucket.acquire(cost)
+            if chat_bucket is not None:
+                throttled = await chat_bucket.acquire(cost) or throttled
+            if throttled:
+                self.counters["throttled"] += 1
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.counters["failed"] += 1
+                    raise
+                self.counters["retried"] += 1
+                delay = e.retry_after + random.uniform(0, min(2**attempt, 10))
+                logger.warning(
+                    "Flood limit on %s, retry %d/%d in %.1f s",
+                    type(method).__name__,
+                    attempt,
+                    self.max_retries,
+                    delay,
+                )
+                (chat_bucket or self.global_bucket).pause(delay)
+
+
+# Every webhook worker keeps its own buckets, so the global limit is split
+# between them. A chat's updates rarely reach two workers at once; the
+# per-chat limit stays as is and 429s are retried anyway.
+_processes = max(1, config.WEBHOOK_WORKERS) if config.WEBHOOK_URL else 1
+
+rate_limiter = RateLimitMiddleware(
+    chat_rate=config.TG_CHAT_RATE,
+    global_rate=config.TG_GLOBAL_RATE / _processes,
+    max_retries=config.TG_MAX_RETRIES,
+)
+
+registry.register(
+    CallbackMetric(
+        "geobot_bot_api_calls_total",
+        "Outbound Bot API calls: requests, throttled, retried after 429, failed",
+        ("event",),
+        lambda: {(event,): value for event, value in rate_limiter.counters.items()},
+        type="counter",
+    )
+)
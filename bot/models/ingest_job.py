@@ -0,0 +1,200 @@
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from database.db import db
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+COLUMNS = """
+    id, created_at, chat_id, status_message_id, file_id, file_name, status,
+    stage, payload, attempts, next_run_at, error, owner
+"""
+
+
+@dataclass
+class IngestJob:
+    id: int
+    created_at: float
+    chat_id: int
+    status_message_id: int | None
+    file_id: str
+    file_name: str | None
+    status: str
+    # Last stage that completed; a resumed job continues after it
+    stage: str | None
+    # Stage results the later stages need (digest, file_path, trip_id)
+    payload: dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    next_run_at: float = 0.0
+    error: str | None = None
+    owner: str | None = None
+
+    def __post_init__(self):
+        if isinstance(self.payload, str):
+            self.payload = json.loads(self.payload)
+
+    @classmethod
+    def create(
+        cls,
+        chat_id: int,
+        status_message_id: int | None,
+        file_id: str,
+        file_name: str | None,
+    ) -> "IngestJob":
+        now = time.time()
+        with db.transaction() as conn:
+            row = conn.execute(
+                f"""
+                INSERT INTO ingest_jobs (created_at, chat_id, status_message_id,
+                                         file_id, file_name, status, next_run_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                RETURNING {COLUMNS}
+            """,
+                (now, chat_id, status_message_id, file_id, file_name, QUEUED, now),
+            ).fetchone()
+        return cls(*row)
+
+    @classmethod
+    def claim(cls, owner: str, lease: float) -> "IngestJob | None":
+        # Oldest job that is due, or one whose owner stopped renewing its
+        # lease (a process that died without requeueing its jobs). The
+        # write transaction makes the claim atomic across processes.
+        now = time.time()
+        with db.transaction() as conn:
+            row = conn.execute(
+                f"""
+                UPDATE ingest_jobs
+                SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM ingest_jobs
+                    WHERE (status = ? AND next_run_at <= ?)
+                       OR (status = ? AND lease_until < ?)
+                    ORDER BY next_run_at, id
+                    LIMIT 1
+                )
+                RETURNING {COLUMNS}
+            """,
+                (RUNNING, owner, now + lease, QUEUED, now, RUNNING, now),
+            ).fetchone()
+        if row:
+            return cls(*row)
+        return None
+
+    def save_progress(self, lease: float):
+        with db.transaction() as conn:
+            conn.execute(
+                """
+                UPDATE ingest_jobs SET stage = ?, payload = ?, lease_until = ?
+                WHERE id = ?
+            """,
+                (self.stage, json.dumps(self.payload), time.time() + lease, self.id),
+            )
+
+    def _set_status(self, status: str, error: str | None, delay: float = 0.0):
+        self.status = status
+        self.error = error
+        self.next_run_at = time.time() + delay
+        with db.transaction() as conn:
+            conn.execute(
+                """
+                UPDATE ingest_jobs
+                SET status = ?, error = ?, next_run_at = ?, payload = ?,
+                    owner = NULL, lease_until = NULL
+                WHERE id = ?
+            """,
+                (status, error, self.next_run_at, json.dumps(self.payload), self.id),
+            )
+
+    def finish(self):
+        self._set_status(DONE, None)
+
+    def fail(self, error: str):
+        self._set_status(FAILED, error)
+
+    def retry(self, error: str, delay: float):
+        self._set_status(QUEUED, error, delay)
+
+    @staticmethod
+    def requeue_owned(owner: str, graceful: bool = False) -> int:
+        # Jobs this process was working on when it stopped. A graceful stop
+        # (deploy, rolling restart) gives the attempt back; after a crash it
+        # counts, so a track that keeps killing the process runs out of them
+        refund = 1 if graceful else 0
+        with db.transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE ingest_jobs
+                SET status = ?, owner = NULL, lease_until = NULL,
+                    attempts = MAX(attempts - ?, 0)
+                WHERE status = ? AND owner = ?
+            """,
+                (QUEUED, refund, RUNNING, owner),
+            )
+        return cursor.rowcount
+
+    def has_twin(self) -> bool:
+        # Another unfinished job that has downloaded the same content
+        with db.read() as conn:
+            row = conn.execute(
+                """
+                SELECT 1 FROM ingest_jobs
+                WHERE id != ? AND status IN (?, ?)
+                  AND json_extract(payload, '$.digest') = ?
+                LIMIT 1
+            """,
+                (self.id, QUEUED, RUNNING, self.payload.get("digest")),
+            ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def purge_finished(older_than: float) -> int:
+        with db.transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM ingest_jobs WHERE status IN (?, ?) AND created_at < ?",
+                (DONE, FAILED, time.time() - older_than),
+            )
+        return cursor.rowcount
+
+    # Async counterparts, run on the database threads (see Database.run)
+
+    @classmethod
+    async def acreate(
+        cls,
+        chat_id: int,
+        status_message_id: int | None,
+        file_id: str,
+        file_name: str | None,
+    ) -> "IngestJob":
+        return await db.run(cls.create, chat_id, status_message_id, file_id, file_name)
+
+    @classmethod
+    async def aclaim(cls, owner: str, lease: float) -> "IngestJob | None":
+        return await db.run(cls.claim, owner, lease)
+
+    async def asave_progress(self, lease: float):
+        await db.run(self.save_progress, lease)
+
+    async def afinish(self):
+        await db.run(self.finish)
+
+    async def afail(self, error: str):
+        await db.run(self.fail, error)
+
+    async def aretry(self, error: str, delay: float):
+        await db.run(self.retry, error, delay)
+
+    async def ahas_twin(self) -> bool:
+        return await db.run(self.has_twin)
+
+    @staticmethod
+    async def arequeue_owned(owner: str, graceful: bool = False) -> int:
+        return await db.run(IngestJob.requeue_owned, owner, graceful)
+
+    @staticmethod
+    async def apurge_finished(older_than: float) -> int:
+        return await db.run(IngestJob.purge_finished, older_than)
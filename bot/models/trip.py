@@ -1,8 +1,8 @@
 from dataclasses import dataclass
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Any
 
-from database.db import db
+from database.db import ROLLUP_SELECT, db
 
 
 @dataclass
@@ -11,33 +11,74 @@ class Media:
     trip_id: int
     file_path: str
     media_type: str
+    file_id: str | None = None
+    sha256: str | None = None
 
     @classmethod
-    def get_by_id(cls, media_id: int) -> Optional["Media"]:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trip_media WHERE id = ?", (media_id,))
-        row = cursor.fetchone()
-        conn.close()
+    def get_by_id(cls, media_id: int) -> "Media | None":
+        with db.read() as conn:
+            row = conn.execute(
+                "SELECT * FROM trip_media WHERE id = ?", (media_id,)
+            ).fetchone()
         if row:
             return cls(*row)
         return None
 
+    def set_file_id(self, file_id: str):
+        with db.transaction() as conn:
+            conn.execute(
+                "UPDATE trip_media SET file_id = ? WHERE id = ?", (file_id, self.id)
+            )
+        self.file_id = file_id
+
+    @classmethod
+    async def aget_by_id(cls, media_id: int) -> "Media | None":
+        return await db.run(cls.get_by_id, media_id)
+
+    async def aset_file_id(self, file_id: str):
+        await db.run(self.set_file_id, file_id)
+
+
+@dataclass
+class MediaSummary:
+    photo_count: int
+    video_count: int
+
+    @property
+    def total(self) -> int:
+        return self.photo_count + self.video_count
+
+
+@dataclass
+class DailyStats:
+    trip_date: date
+    trip_count: int
+    distance_sum: float
+    duration_sum: int
+    avg_speed_sum: float
+    avg_speed_count: int
+    max_speed: float | None
+
+    def __post_init__(self):
+        if isinstance(self.trip_date, str):
+            self.trip_date = datetime.strptime(self.trip_date, "%Y-%m-%d").date()
+
 
 @dataclass
 class Trip:
     id: int
     created_at: datetime
     trip_date: date
-    distance: Optional[float]
-    duration: Optional[int]
-    avg_speed: Optional[float]
-    max_speed: Optional[float]
-    min_elevation: Optional[float]
-    max_elevation: Optional[float]
-    elevation_gain: Optional[float]
-    gpx_path: Optional[str]
-    notes: Optional[str]
+    distance: float | None
+    duration: int | None
+    avg_speed: float | None
+    max_speed: float | None
+    min_elevation: float | None
+    max_elevation: float | None
+    elevation_gain: float | None
+    gpx_path: str | None
+    notes: str | None
+    gpx_sha256: str | None = None
 
     def __post_init__(self):
         # Convert string dates/timestamps from DB to datetime objects
@@ -48,124 +89,479 @@ class Trip:
             self.created_at = datetime.fromisoformat(self.created_at)
 
     @classmethod
-    def create(cls, **kwargs) -> Optional["Trip"]:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO trips (trip_date, distance, duration, avg_speed, max_speed,
-                             min_elevation, max_elevation, elevation_gain,
-            gpx_path, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                kwargs.get("trip_date"),
-                kwargs.get("distance"),
-                kwargs.get("duration"),
-                kwargs.get("avg_speed"),
-                kwargs.get("max_speed"),
-                kwargs.get("min_elevation"),
-                kwargs.get("max_elevation"),
-                kwargs.get("elevation_gain"),
-                kwargs.get("gpx_path"),
-                kwargs.get("notes"),
-            ),
-        )
-        conn.commit()
-        trip_id = cursor.lastrowid
-        conn.close()
+    def create(cls, **kwargs) -> "Trip | None":
+        with db.transaction() as conn:
+            trip_id = _insert_trip(conn, kwargs)
+            _refresh_daily_rollup(conn, kwargs.get("trip_date"))
         return cls.get_by_id(trip_id)
 
     @classmethod
-    def get_by_id(cls, trip_id: int) -> Optional["Trip"]:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trips WHERE id = ?", (trip_id,))
-        row = cursor.fetchone()
-        conn.close()
+    def create_many(cls, rows: list[dict[str, Any]], series: list[bytes]) -> list[int]:
+        # Bulk import: every trip, its series and the touched rollup days in a
+        # single transaction, so a failed import leaves nothing behind
+        with db.transaction() as conn:
+            trip_ids = []
+            for kwargs, data in zip(rows, series):
+                trip_id = _insert_trip(conn, kwargs)
+                conn.execute(
+                    "INSERT INTO trip_series (trip_id, data) VALUES (?, ?)",
+                    (trip_id, data),
+                )
+                trip_ids.append(trip_id)
+            for trip_date in {kwargs.get("trip_date") for kwargs in rows}:
+                _refresh_daily_rollup(conn, trip_date)
+        return trip_ids
+
+    @classmethod
+    def get_by_id(cls, trip_id: int) -> "Trip | None":
+        with db.read() as conn:
+            row = conn.execute(
+                "SELECT * FROM trips WHERE id = ?", (trip_id,)
+            ).fetchone()
+        if row:
+            return cls(*row)
+        return None
+
+    @classmethod
+    def get_by_gpx_sha256(cls, digest: str) -> "Trip | None":
+        with db.read() as conn:
+            row = conn.execute(
+                "SELECT * FROM trips WHERE gpx_sha256 = ?", (digest,)
+            ).fetchone()
         if row:
             return cls(*row)
         return None
 
     @classmethod
-    def get_all(cls) -> List["Trip"]:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trips ORDER BY trip_date DESC, id DESC")
-        rows = cursor.fetchall()
-        conn.close()
+    def get_existing_gpx_hashes(cls, digests: list[str]) -> set[str]:
+        found = set()
+        with db.read() as conn:
+            # Chunked to stay under SQLite's bound-parameter limit
+            for i in range(0, len(digests), 500):
+                chunk = digests[i : i + 500]
+                rows = conn.execute(
+                    f"""
+                    SELECT gpx_sha256 FROM trips
+                    WHERE gpx_sha256 IN ({", ".join("?" * len(chunk))})
+                """,
+                    chunk,
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    @classmethod
+    def get_all(cls) -> list["Trip"]:
+        with db.read() as conn:
+            rows = conn.execute(
+                "SELECT * FROM trips ORDER BY trip_date DESC, id DESC"
+            ).fetchall()
         return [cls(*row) for row in rows]
 
     @classmethod
-    def get_paginated(cls, page: int, per_page: int) -> List["Trip"]:
+    def get_paginated(cls, page: int, per_page: int) -> list["Trip"]:
         offset = (page - 1) * per_page
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT * FROM trips
-            ORDER BY trip_date DESC, id DESC
-            LIMIT ? OFFSET ?
-        """,
-            (per_page, offset),
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        with db.read() as conn:
+            rows = conn.execute(
+                """
+                SELECT * FROM trips
+                ORDER BY trip_date DESC, id DESC
+                LIMIT ? OFFSET ?
+            """,
+                (per_page, offset),
+            ).fetchall()
+        return [cls(*row) for row in rows]
+
+    @classmethod
+    def get_page(
+        cls,
+        cursor: tuple[str, int] | None,
+        per_page: int,
+        direction: str = "next",
+    ) -> list["Trip"]:
+        # Keyset pagination over (trip_date, id), newest first. cursor is the
+        # (trip_date, id) of a row on the neighbouring page:
+        #   "next"  - trips older than the cursor
+        #   "prev"  - trips newer than the cursor
+        #   "from"  - the page starting at the cursor itself
+        # Every page is an index seek, so page N costs the same as page 1.
+        where, order, params = _page_clause(cursor, direction)
+        with db.read() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT * FROM trips {where}
+                ORDER BY trip_date {order}, id {order}
+                LIMIT ?
+            """,
+                (*params, per_page),
+            ).fetchall()
+        if order == "ASC":
+            rows.reverse()
         return [cls(*row) for row in rows]
 
+    @classmethod
+    def get_page_with_media_summary(
+        cls,
+        cursor: tuple[str, int] | None,
+        per_page: int,
+        direction: str = "next",
+    ) -> list[tuple["Trip", "MediaSummary"]]:
+        # Same page as get_page, with media counts from one grouped join
+        where, order, params = _page_clause(cursor, direction)
+        with db.read() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT t.*,
+                       COUNT(CASE WHEN m.media_type = 'photo' THEN 1 END),
+                       COUNT(CASE WHEN m.media_type = 'video' THEN 1 END)
+                FROM (
+                    SELECT * FROM trips {where}
+                    ORDER BY trip_date {order}, id {order}
+                    LIMIT ?
+                ) AS t
+                LEFT JOIN trip_media AS m ON m.trip_id = t.id
+                GROUP BY t.id
+                ORDER BY t.trip_date {order}, t.id {order}
+            """,
+                (*params, per_page),
+            ).fetchall()
+        if order == "ASC":
+            rows.reverse()
+        return [(cls(*row[:-2]), MediaSummary(*row[-2:])) for row in rows]
+
     @classmethod
     def count_all(cls) -> int:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM trips")
-        count = int(cursor.fetchone()[0])
-        conn.close()
-        return count
-
-    @classmethod
-    def get_last(cls) -> Optional["Trip"]:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trips ORDER BY trip_date DESC, id DESC LIMIT 1")
-        row = cursor.fetchone()
-        conn.close()
+        with db.read() as conn:
+            return int(conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0])
+
+    @classmethod
+    def get_last(cls) -> "Trip | None":
+        with db.read() as conn:
+            row = conn.execute(
+                "SELECT * FROM trips ORDER BY trip_date DESC, id DESC LIMIT 1"
+            ).fetchone()
         if row:
             return cls(*row)
         return None
 
-    def delete(self):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM trips WHERE id = ?", (self.id,))
-        conn.commit()
-        conn.close()
-
-    def get_media(self) -> List[Media]:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trip_media WHERE trip_id = ?", (self.id,))
-        rows = cursor.fetchall()
-        conn.close()
+    def delete(self) -> list[str]:
+        # trip_media and trip_series rows go with it (ON DELETE CASCADE).
+        # Returns the media files no other trip references any more.
+        with db.transaction() as conn:
+            rows = conn.execute(
+                "SELECT file_path, sha256 FROM trip_media WHERE trip_id = ?",
+                (self.id,),
+            ).fetchall()
+            orphaned = _release_media(conn, rows)
+            conn.execute("DELETE FROM trips WHERE id = ?", (self.id,))
+            _refresh_daily_rollup(conn, self.trip_date)
+        return orphaned
+
+    @classmethod
+    def get_daily_stats(cls, start_date: date) -> list["DailyStats"]:
+        # One range query over the rollup instead of loading every trip
+        with db.read() as conn:
+            rows = conn.execute(
+                """
+                SELECT * FROM trip_daily_rollup
+                WHERE trip_date >= ?
+                ORDER BY trip_date DESC
+            """,
+                (start_date,),
+            ).fetchall()
+        return [DailyStats(*row) for row in rows]
+
+    @classmethod
+    def rebuild_daily_rollup(cls) -> int:
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM trip_daily_rollup")
+            conn.execute(
+                f"INSERT INTO trip_daily_rollup {ROLLUP_SELECT} GROUP BY trip_date"
+            )
+            return conn.execute("SELECT COUNT(*) FROM trip_daily_rollup").fetchone()[0]
+
+    def get_series(self) -> bytes | None:
+        with db.read() as conn:
+            row = conn.execute(
+                "SELECT data FROM trip_series WHERE trip_id = ?", (self.id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save_series(self, data: bytes):
+        # Packed, downsampled speed/elevation series (see bot.services.series)
+        with db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO trip_series (trip_id, data) VALUES (?, ?)",
+                (self.id, data),
+            )
+
+    def get_media_summary(self) -> "MediaSummary":
+        with db.read() as conn:
+            row = conn.execute(
+                """
+                SELECT COUNT(CASE WHEN media_type = 'photo' THEN 1 END),
+                       COUNT(CASE WHEN media_type = 'video' THEN 1 END)
+                FROM trip_media WHERE trip_id = ?
+            """,
+                (self.id,),
+            ).fetchone()
+        return MediaSummary(*row)
+
+    def get_graphic_file_id(self, cache_key: str) -> str | None:
+        # Only valid for the image version identified by cache_key
+        with db.read() as conn:
+            row = conn.execute(
+                """
+                SELECT file_id FROM trip_graphic_file_ids
+                WHERE trip_id = ? AND cache_key = ?
+            """,
+                (self.id, cache_key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_graphic_file_id(self, cache_key: str, file_id: str):
+        with db.transaction() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO trip_graphic_file_ids
+                    (trip_id, cache_key, file_id)
+                VALUES (?, ?, ?)
+            """,
+                (self.id, cache_key, file_id),
+            )
+
+    def get_media(self) -> list[Media]:
+        with db.read() as conn:
+            rows = conn.execute(
+                "SELECT * FROM trip_media WHERE trip_id = ?", (self.id,)
+            ).fetchall()
         return [Media(*row) for row in rows]
 
-    def add_media(self, file_path: str, media_type: str) -> Optional[Media]:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO trip_media (trip_id, file_path, media_type)
-            VALUES (?, ?, ?)
-        """,
-            (self.id, file_path, media_type),
-        )
-        conn.commit()
-        media_id = cursor.lastrowid
-        conn.close()
+    def get_media_by_sha256(self, digest: str) -> Media | None:
+        with db.read() as conn:
+            row = conn.execute(
+                "SELECT * FROM trip_media WHERE trip_id = ? AND sha256 = ?",
+                (self.id, digest),
+            ).fetchone()
+        if row:
+            return Media(*row)
+        return None
+
+    def add_media(
+        self,
+        file_path: str,
+        media_type: str,
+        file_id: str | None = None,
+        sha256: str | None = None,
+    ) -> Media | None:
+        with db.transaction() as conn:
+            if sha256 is not None:
+                conn.execute(
+                    """
+                    INSERT INTO media_blobs (sha256, file_path, refcount)
+                    VALUES (?, ?, 1)
+                    ON CONFLICT (sha256) DO UPDATE SET refcount = refcount + 1
+                """,
+                    (sha256, file_path),
+                )
+            cursor = conn.execute(
+                """
+                INSERT INTO trip_media (trip_id, file_path, media_type, file_id, sha256)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                (self.id, file_path, media_type, file_id, sha256),
+            )
+            media_id = cursor.lastrowid
         return Media.get_by_id(media_id)
 
-    def remove_media(self, media_id: int):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM trip_media WHERE id = ?", (media_id,))
-        conn.commit()
-        conn.close()
+    def remove_media(self, media_id: int) -> list[str]:
+        # Returns the file to delete if this was its last reference
+        with db.transaction() as conn:
+            # Scoped to this trip: another trip's media id deletes nothing
+            # and releases nothing
+            rows = conn.execute(
+                "DELETE FROM trip_media WHERE id = ? AND trip_id = ? "
+                "RETURNING file_path, sha256",
+                (media_id, self.id),
+            ).fetchall()
+            if not rows:
+                return []
+            return _release_media(conn, rows)
+
+    # Async counterparts for handlers: the same queries run on the database
+    # threads (see Database.run); the sync API stays for scripts and tests
+
+    @classmethod
+    async def acreate(cls, **kwargs) -> "Trip | None":
+        return await db.run(cls.create, **kwargs)
+
+    @classmethod
+    async def acreate_many(
+        cls, rows: list[dict[str, Any]], series: list[bytes]
+    ) -> list[int]:
+        return await db.run(cls.create_many, rows, series)
+
+    @classmethod
+    async def aget_existing_gpx_hashes(cls, digests: list[str]) -> set[str]:
+        return await db.run(cls.get_existing_gpx_hashes, digests)
+
+    @classmethod
+    async def aget_by_id(cls, trip_id: int) -> "Trip | None":
+        return await db.run(cls.get_by_id, trip_id)
+
+    @classmethod
+    async def aget_by_gpx_sha256(cls, digest: str) -> "Trip | None":
+        return await db.run(cls.get_by_gpx_sha256, digest)
+
+    @classmethod
+    async def aget_all(cls) -> list["Trip"]:
+        return await db.run(cls.get_all)
+
+    @classmethod
+    async def aget_paginated(cls, page: int, per_page: int) -> list["Trip"]:
+        return await db.run(cls.get_paginated, page, per_page)
+
+    @classmethod
+    async def aget_page(
+        cls,
+        cursor: tuple[str, int] | None,
+        per_page: int,
+        direction: str = "next",
+    ) -> list["Trip"]:
+        return await db.run(cls.get_page, cursor, per_page, direction)
+
+    @classmethod
+    async def aget_page_with_media_summary(
+        cls,
+        cursor: tuple[str, int] | None,
+        per_page: int,
+        direction: str = "next",
+    ) -> list[tuple["Trip", "MediaSummary"]]:
+        return await db.run(
+            cls.get_page_with_media_summary, cursor, per_page, direction
+        )
+
+    @classmethod
+    async def acount_all(cls) -> int:
+        return await db.run(cls.count_all)
+
+    @classmethod
+    async def aget_last(cls) -> "Trip | None":
+        return await db.run(cls.get_last)
+
+    async def adelete(self) -> list[str]:
+        return await db.run(self.delete)
+
+    @classmethod
+    async def aget_daily_stats(cls, start_date: date) -> list["DailyStats"]:
+        return await db.run(cls.get_daily_stats, start_date)
+
+    @classmethod
+    async def arebuild_daily_rollup(cls) -> int:
+        return await db.run(cls.rebuild_daily_rollup)
+
+    async def aget_series(self) -> bytes | None:
+        return await db.run(self.get_series)
+
+    async def asave_series(self, data: bytes):
+        await db.run(self.save_series, data)
+
+    async def aget_media_summary(self) -> "MediaSummary":
+        return await db.run(self.get_media_summary)
+
+    async def aget_media(self) -> list[Media]:
+        return await db.run(self.get_media)
+
+    async def aget_media_by_sha256(self, digest: str) -> Media | None:
+        return await db.run(self.get_media_by_sha256, digest)
+
+    async def aadd_media(
+        self,
+        file_path: str,
+        media_type: str,
+        file_id: str | None = None,
+        sha256: str | None = None,
+    ) -> Media | None:
+        return await db.run(self.add_media, file_path, media_type, file_id, sha256)
+
+    async def aget_graphic_file_id(self, cache_key: str) -> str | None:
+        return await db.run(self.get_graphic_file_id, cache_key)
+
+    async def aset_graphic_file_id(self, cache_key: str, file_id: str):
+        await db.run(self.set_graphic_file_id, cache_key, file_id)
+
+    async def aremove_media(self, media_id: int) -> list[str]:
+        return await db.run(self.remove_media, media_id)
+
+
+def _insert_trip(conn, kwargs: dict[str, Any]) -> int:
+    cursor = conn.execute(
+        """
+        INSERT INTO trips (trip_date, distance, duration, avg_speed, max_speed,
+                         min_elevation, max_elevation, elevation_gain,
+        gpx_path, notes, gpx_sha256)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+        (
+            kwargs.get("trip_date"),
+            kwargs.get("distance"),
+            kwargs.get("duration"),
+            kwargs.get("avg_speed"),
+            kwargs.get("max_speed"),
+            kwargs.get("min_elevation"),
+            kwargs.get("max_elevation"),
+            kwargs.get("elevation_gain"),
+            kwargs.get("gpx_path"),
+            kwargs.get("notes"),
+            kwargs.get("gpx_sha256"),
+        ),
+    )
+    return cursor.lastrowid
+
+
+def _page_clause(
+    cursor: tuple[str, int] | None, direction: str
+) -> tuple[str, str, tuple]:
+    # WHERE clause, sort order and parameters for a keyset page (see get_page)
+    if cursor is None:
+        return "", "DESC", ()
+    if direction == "prev":
+        return "WHERE (trip_date, id) > (?, ?)", "ASC", cursor
+    if direction == "from":
+        return "WHERE (trip_date, id) <= (?, ?)", "DESC", cursor
+    return "WHERE (trip_date, id) < (?, ?)", "DESC", cursor
+
+
+def _refresh_daily_rollup(conn, trip_date):
+    # Recompute a single day from trips (an index range on trip_date); runs in
+    # the caller's transaction so the rollup never disagrees with trips
+    conn.execute("DELETE FROM trip_daily_rollup WHERE trip_date = ?", (trip_date,))
+    conn.execute(
+        f"""
+        INSERT INTO trip_daily_rollup {ROLLUP_SELECT}
+        WHERE trip_date = ? GROUP BY trip_date
+    """,
+        (trip_date,),
+    )
+
+
+def _release_media(conn, rows) -> list[str]:
+    # Drops one reference per (file_path, sha256) row and returns the files
+    # nothing points to any more. Media stored before content addressing has
+    # no sha256 and is owned by its row alone.
+    orphaned = []
+    for file_path, sha256 in rows:
+        if sha256 is None:
+            orphaned.append(file_path)
+            continue
+        conn.execute(
+            "UPDATE media_blobs SET refcount = refcount - 1 WHERE sha256 = ?",
+            (sha256,),
+        )
+        row = conn.execute(
+            "DELETE FROM media_blobs WHERE sha256 = ? AND refcount <= 0 "
+            "RETURNING file_path",
+            (sha256,),
+        ).fetchone()
+        if row:
+            orphaned.append(row[0])
+    return orphaned
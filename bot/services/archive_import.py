@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from collections.abc import Awaitable, Callable, Iterator
+from dataclasses import dataclass, field
+from functools import partial
+from typing import (
+    IO,
+    Any,
+)
+
+import config
+from bot.models.trip import Trip
+from bot.services.blob_store import (
+    HashingWriter,
+    content_path,
+    discard,
+    discard_gpx,
+    store,
+)
+from bot.services.ingest import process_gpx
+from bot.services.logs import span
+from bot.services.metrics import INGEST_STAGE_SECONDS, observe_stages
+from bot.services.profiling import profiler
+from bot.services.worker_pool import ingest_pool
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = (".zip", ".tar.gz", ".tgz")
+CHUNK_SIZE = 64 * 1024
+
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+@dataclass
+class ImportResult:
+    trip_ids: list[int] = field(default_factory=list)
+    # (member name, reason) for every file that did not become a trip
+    rejected: list[tuple[str, str]] = field(default_factory=list)
+    files: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+
+
+def is_archive(file_name: str) -> bool:
+    return file_name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _members(archive_path: str) -> Iterator[tuple[str, int, Callable[[], IO[bytes]]]]:
+    # (name, uncompressed size, opener) for every regular file. tar archives
+    # are read in stream mode, so each opener is only valid until the next
+    # member is requested.
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, partial(archive.open, info)
+        return
+
+    with tarfile.open(archive_path, "r|*") as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, member.size, partial(archive.extractfile, member)
+
+
+def _is_junk(name: str) -> bool:
+    # Finder and Windows metadata that archivers add next to the real files
+    base = os.path.basename(name)
+    return name.startswith("__MACOSX/") or base.startswith("._") or base == ".DS_Store"
+
+
+def _copy_hashed(source: IO[bytes], directory: str, max_bytes: int) -> tuple[str, str]:
+    tmp_path = os.path.join(directory, f".import-{uuid.uuid4().hex}")
+    writer = HashingWriter(tmp_path)
+    try:
+        while chunk := source.read(CHUNK_SIZE):
+            writer.write(chunk)
+            # The header size can lie; enforce the limit on the actual bytes
+            if writer.size > max_bytes:
+                raise ValueError("file too large")
+    except BaseException:
+        writer.close()
+        discard(tmp_path)
+        raise
+    writer.close()
+    digest = writer.sha256.hexdigest()
+    return digest, store(tmp_path, content_path(directory, digest, ".gpx"))
+
+
+def extract_tracks(
+    archive_path: str, directory: str, max_member_bytes: int
+) -> tuple[list[tuple[str, str, str]], list[tuple[str, str]], int]:
+    """Stream every ``.gpx`` member of a ZIP or tar archive into ``directory``.
+
+    Members are copied one at a time straight to their content address, so
+    nothing else from the archive touches the disk. Returns
+    ``(name, sha256, path)`` per track, the rejected members and the number
+    of bytes read.
+    """
+    tracks = []
+    rejected = []
+    total_bytes = 0
+    for name, size, open_member in _members(archive_path):
+        if _is_junk(name):
+            continue
+        if not name.lower().endswith(".gpx"):
+            rejected.append((name, "не GPX"))
+            continue
+        if size > max_member_bytes:
+            rejected.append((name, "слишком большой файл"))
+            continue
+        try:
+            with open_member() as source:
+                digest, path = _copy_hashed(source, directory, max_member_bytes)
+        except ValueError:
+            rejected.append((name, "слишком большой файл"))
+            continue
+        total_bytes += os.path.getsize(path)
+        tracks.append((name, digest, path))
+    return tracks, rejected, total_bytes
+
+
+async def _discard_unused(rows: list[dict[str, Any]]):
+    # The insert failed as a whole; drop the extracted tracks, except those a
+    # concurrent upload has turned into a trip in the meantime
+    try:
+        taken = await Trip.aget_existing_gpx_hashes([r["gpx_sha256"] for r in rows])
+    except Exception:
+        logger.exception("Import: leaving %d extracted tracks on disk", len(rows))
+        return
+    for row in rows:
+        if row["gpx_sha256"] not in taken:
+            discard_gpx(row["gpx_path"])
+
+
+async def import_archive(
+    archive_path: str, progress: ProgressCallback | None = None
+) -> ImportResult:
+    """Import every GPX track in an archive as a trip.
+
+    Tracks are parsed in the ingest pool in parallel and all trips are
+    inserted in one transaction. Infographics are not rendered here: the
+    render cache builds them on first view.
+    """
+    started = time.monotonic()
+    result = ImportResult()
+
+    with span(logger, "extract", INGEST_STAGE_SECONDS, level=logging.INFO) as extract:
+        tracks, result.rejected, result.bytes = await asyncio.to_thread(
+            extract_tracks,
+            archive_path,
+            config.TRACKS_DIR,
+            config.IMPORT_MAX_FILE_MB * 1024 * 1024,
+        )
+        extract.set(tracks=len(tracks), rejected=len(result.rejected))
+    result.files = len(tracks) + len(result.rejected)
+
+    # Duplicates share the content address with an existing trip's file, so
+    # they are only skipped, never deleted
+    existing = await Trip.aget_existing_gpx_hashes([digest for _, digest, _ in tracks])
+    jobs = []
+    for name, digest, path in tracks:
+        if digest in existing:
+            result.rejected.append((name, "уже загружен"))
+            continue
+        existing.add(digest)
+        jobs.append((name, digest, path))
+
+    async def process(job):
+        try:
+            outcome = await ingest_pool.run(
+                process_gpx, job[2], profile=profiler.take("jobs")
+            )
+            return job, outcome
+        except Exception as e:
+            return job, e
+
+    rows = []
+    series = []
+    done = 0
+    for next_done in asyncio.as_completed([process(job) for job in jobs]):
+        (name, digest, path), outcome = await next_done
+        done += 1
+        if isinstance(outcome, Exception):
+            logger.warning("Import: %s rejected: %s", name, outcome)
+            result.rejected.append((name, str(outcome) or type(outcome).__name__))
+            discard_gpx(path)
+        else:
+            metrics, packed, timings = outcome
+            observe_stages(timings)
+            rows.append({**metrics, "gpx_path": path, "gpx_sha256": digest})
+            series.append(packed)
+        if progress is not None:
+            await progress(done, len(jobs))
+
+    if rows:
+        try:
+            with span(logger, "db_write", INGEST_STAGE_SECONDS, trips=len(rows)):
+                result.trip_ids = await Trip.acreate_many(rows, series)
+        except Exception:
+            await _discard_unused(rows)
+            raise
+    result.elapsed = time.monotonic() - started
+    logger.info(
+        "Imported %d of %d files in %.1f s",
+        len(result.trip_ids),
+        result.files,
+        result.elapsed,
+    )
+    return result
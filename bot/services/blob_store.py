@@ -0,0 +1,80 @@
+import hashlib
+import os
+import uuid
+
+from aiogram import Bot
+
+
+class HashingWriter:
+    # File-like destination for Bot.download_file: hashes chunks as they are
+    # written, so the content address is known without reading the file again
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self._file = open(path, "wb")
+
+    def write(self, chunk: bytes) -> int:
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        return self._file.write(chunk)
+
+    def flush(self):
+        self._file.flush()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._file.seek(offset, whence)
+
+    def close(self):
+        self._file.close()
+
+
+async def download_hashed(
+    bot: Bot, file_id: str, directory: str
+) -> tuple[str, str, str]:
+    """Download a Telegram file into ``directory`` under a temporary name.
+
+    Returns ``(sha256 hex digest, temporary path, extension)``; the caller
+    either moves the file to its content address with ``store`` or discards it.
+    """
+    file = await bot.get_file(file_id)
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}")
+    writer = HashingWriter(tmp_path)
+    try:
+        await bot.download_file(file.file_path, writer, seek=False)
+    except BaseException:
+        writer.close()
+        discard(tmp_path)
+        raise
+    writer.close()
+    return writer.sha256.hexdigest(), tmp_path, os.path.splitext(file.file_path)[1]
+
+
+def content_path(directory: str, digest: str, suffix: str) -> str:
+    return os.path.join(directory, f"{digest}{suffix}")
+
+
+def store(tmp_path: str, path: str) -> str:
+    # Identical content already on disk: keep that copy
+    if os.path.exists(path):
+        discard(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return path
+
+
+def discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard_gpx(gpx_path: str):
+    # A stored GPX and the binary track ingest writes next to it. Imported
+    # here to keep numpy out of the bot's start-up
+    from bot.services.track_store import track_path
+
+    discard(gpx_path)
+    discard(track_path(gpx_path))
@@ -1,9 +1,120 @@
 import math
+from collections.abc import Sequence
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any
 
+import numpy as np
 
-def calculate_metrics(points: List[Dict[str, Any]]) -> Dict[str, Any]:
+from bot.services.gpx_parser import TrackColumns, TrackPoints
+from bot.services.track_store import StoredTrack
+
+EARTH_RADIUS = 6371000
+
+# calculate_metrics and calculate_metrics_scalar agree to within this relative
+# tolerance on float fields; the difference comes from summation order only
+# (numpy uses pairwise summation, the scalar loop accumulates left to right).
+# "duration" is an integer and may differ by at most 1 second for the same
+# reason.
+PARITY_RTOL = 1e-9
+
+
+def calculate_metrics(points: Sequence[dict[str, Any]]) -> dict[str, Any]:
+    if len(points) < 2:
+        raise ValueError("Need at least 2 points for calculation")
+
+    lat, lon, elevation, time = points_as_arrays(points)
+
+    distances = haversine_distances(lat, lon)
+    total_distance = float(distances.sum())
+
+    # NaN marks a missing timestamp; comparisons with NaN are False so
+    # segments with a missing end are dropped, like in the scalar path
+    time_diffs = np.diff(time)
+    with np.errstate(invalid="ignore"):
+        timed = time_diffs > 0
+    speeds = (distances[timed] / 1000) / (time_diffs[timed] / 3600)
+    total_time = float(time_diffs[timed].sum())
+
+    known_elevations = elevation[~np.isnan(elevation)]
+    elev_diffs = np.diff(elevation)
+    with np.errstate(invalid="ignore"):
+        elevation_gain = float(elev_diffs[elev_diffs > 0].sum())
+
+    return {
+        "distance": total_distance,
+        "duration": int(total_time),
+        "avg_speed": float(speeds.mean()) if speeds.size else None,
+        "max_speed": float(speeds.max()) if speeds.size else None,
+        "min_elevation": (
+            float(known_elevations.min()) if known_elevations.size else None
+        ),
+        "max_elevation": (
+            float(known_elevations.max()) if known_elevations.size else None
+        ),
+        "elevation_gain": elevation_gain,
+        "trip_date": _trip_date(points),
+    }
+
+
+def haversine_distances(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    # Distance in metres between each pair of consecutive points
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    )
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def points_as_arrays(
+    points: Sequence[dict[str, Any]],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    if isinstance(points, TrackPoints):
+        return columns_as_arrays(points.columns)
+    if isinstance(points, StoredTrack):
+        return points.arrays()
+
+    n = len(points)
+    lat = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=n)
+    lon = np.fromiter((p["lon"] for p in points), dtype=np.float64, count=n)
+    elevation = np.fromiter(
+        (_or_nan(p.get("elevation")) for p in points), dtype=np.float64, count=n
+    )
+    time = np.fromiter(
+        (_or_nan(t.timestamp() if (t := p.get("time")) else None) for p in points),
+        dtype=np.float64,
+        count=n,
+    )
+    return lat, lon, elevation, time
+
+
+def columns_as_arrays(
+    columns: TrackColumns,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Zero-copy: array('d') exposes the buffer protocol
+    return (
+        np.frombuffer(columns.lat, dtype=np.float64),
+        np.frombuffer(columns.lon, dtype=np.float64),
+        np.frombuffer(columns.elevation, dtype=np.float64),
+        np.frombuffer(columns.time, dtype=np.float64),
+    )
+
+
+def _or_nan(value: float | None) -> float:
+    return math.nan if value is None else value
+
+
+def _trip_date(points: Sequence[dict[str, Any]]):
+    trip_time = points[0].get("time")
+    return trip_time.date() if trip_time else datetime.now().date()
+
+
+def calculate_metrics_scalar(points: Sequence[dict[str, Any]]) -> dict[str, Any]:
+    # Reference implementation, kept for parity checks against calculate_metrics
     if len(points) < 2:
         raise ValueError("Need at least 2 points for calculation")
 
@@ -66,7 +177,7 @@ def calculate_metrics(points: List[Dict[str, Any]]) -> Dict[str, Any]:
 
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371000
+    R = EARTH_RADIUS
 
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from copy import copy
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    StateType,
+    StorageKey,
+)
+
+import config
+from database.db import Database, db
+
+logger = logging.getLogger(__name__)
+
+# Expired rows are deleted from the table at most this often
+PURGE_INTERVAL = 3600.0
+
+
+@dataclass
+class StateRecord:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    updated_at: float = 0.0
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage in the bot's SQLite database.
+
+    Reads are served from an LRU cache, so once a chat's state has been
+    loaded the callback path never waits on SQLite. Writes update the cache
+    immediately and are flushed to the ``fsm_states`` table in one
+    transaction every ``flush_interval`` seconds (``0`` writes through).
+    A state that hasn't been written for ``ttl`` seconds reads as empty and
+    its row is purged.
+
+    When several processes share the table, ``cache_size=0`` and
+    ``flush_interval=0`` make every read see the other processes' writes.
+    """
+
+    def __init__(
+        self,
+        database: Database = db,
+        ttl: float = config.FSM_STATE_TTL,
+        cache_size: int = config.FSM_CACHE_SIZE,
+        flush_interval: float = config.FSM_FLUSH_INTERVAL,
+    ):
+        self.db = database
+        self.ttl = ttl
+        self.cache_size = max(0, cache_size)
+        self.flush_interval = flush_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache: OrderedDict[str, StateRecord] = OrderedDict()
+        # Written to the cache but not yet to the table; a record can be
+        # evicted from the cache before it is flushed, so reads check here too
+        self._dirty: dict[str, StateRecord] = {}
+        self._flusher: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._last_purge = 0.0
+
+    # Cache
+
+    async def _get(self, key: StorageKey) -> StateRecord:
+        name = self.key_builder.build(key)
+        record = self._cache.get(name)
+        if record is not None:
+            self._cache.move_to_end(name)
+        else:
+            record = self._dirty.get(name)
+            if record is None:
+                record = await self.db.run(self._load, name)
+            self._remember(name, record)
+
+        if not record.empty and record.updated_at < time.time() - self.ttl:
+            return StateRecord()
+        return record
+
+    def _remember(self, name: str, record: StateRecord):
+        if not self.cache_size:
+            return
+        self._cache[name] = record
+        self._cache.move_to_end(name)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _put(self, key: StorageKey, state: str | None, data: dict[str, Any]):
+        name = self.key_builder.build(key)
+        record = StateRecord(state, data, time.time())
+        self._remember(name, record)
+        self._dirty[name] = record
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    # BaseStorage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get(key)
+        state = state.state if isinstance(state, State) else state
+        await self._put(key, state, record.data)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._get(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        record = await self._get(key)
+        await self._put(key, record.state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._get(key)).data.copy()
+
+    async def get_value(
+        self, storage_key: StorageKey, dict_key: str, default: Any = None
+    ) -> Any:
+        return copy((await self._get(storage_key)).data.get(dict_key, default))
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._wake.set()
+            await self._flusher
+        await self.flush()
+
+    # Persistence
+
+    async def _flush_loop(self):
+        # One flusher at a time keeps writes to the same key in order
+        try:
+            while self._dirty:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+                except TimeoutError:
+                    pass
+                if not await self.flush() and self._wake.is_set():
+                    # Closing and the database is failing: give up
+                    break
+        finally:
+            self._flusher = None
+
+    async def flush(self) -> bool:
+        async with self._flush_lock:
+            if not self._dirty:
+                return True
+            batch = list(self._dirty.items())
+            self._dirty.clear()
+            purge = time.time() - self._last_purge > PURGE_INTERVAL
+            try:
+                await self.db.run(self._write, batch, purge)
+            except Exception:
+                logger.exception("Failed to save %d FSM states", len(batch))
+                for name, record in batch:
+                    # Keep anything written while the flush was running
+                    self._dirty.setdefault(name, record)
+                return False
+            if purge:
+                self._last_purge = time.time()
+            return True
+
+    def _load(self, name: str) -> StateRecord:
+        with self.db.read() as conn:
+            row = conn.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE key = ?",
+                (name,),
+            ).fetchone()
+        if row is None:
+            return StateRecord()
+        return StateRecord(row[0], json.loads(row[1]), row[2])
+
+    def _write(self, batch: list[tuple[str, StateRecord]], purge: bool):
+        with self.db.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO fsm_states (key, state, data, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    updated_at = excluded.updated_at
+            """,
+                (
+                    (name, r.state, json.dumps(r.data), r.updated_at)
+                    for name, r in batch
+                    if not r.empty
+                ),
+            )
+            conn.executemany(
+                "DELETE FROM fsm_states WHERE key = ?",
+                ((name,) for name, r in batch if r.empty),
+            )
+            if purge:
+                conn.execute(
+                    "DELETE FROM fsm_states WHERE updated_at < ?",
+                    (time.time() - self.ttl,),
+                )
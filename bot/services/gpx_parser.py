@@ -1,26 +1,201 @@
-from typing import Any, Dict
+import math
+import xml.etree.ElementTree as ET
+from array import array
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta, timezone
+from typing import Any
 
-import gpxpy
+NAN = float("nan")
 
 
-def parse_gpx(file_path: str) -> Dict[str, Any]:
+@dataclass
+class TrackColumns:
+    # Compact columnar storage: 8 bytes per value instead of a dict per point.
+    # Missing elevation/time values are stored as NaN.
+    lat: array = field(default_factory=lambda: array("d"))
+    lon: array = field(default_factory=lambda: array("d"))
+    elevation: array = field(default_factory=lambda: array("d"))
+    time: array = field(default_factory=lambda: array("d"))  # epoch seconds
+    name: str | None = None
+    # UTC offset of the first timestamp, used to rebuild aware datetimes
+    tz_offset: int = 0
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def append(self, lat: float, lon: float, elevation: float, time: float):
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.elevation.append(elevation)
+        self.time.append(time)
+
+
+class TrackPoints(Sequence):
+    """Read-only list-of-dicts view over TrackColumns.
+
+    Dicts are built on access, so existing consumers of ``gpx_data["points"]``
+    keep working without materialising the whole track.
+    """
+
+    def __init__(self, columns: TrackColumns):
+        self.columns = columns
+        self._tz = timezone(timedelta(seconds=columns.tz_offset))
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def __repr__(self) -> str:
+        return f"TrackPoints(n={len(self)})"
+
+    def _point(self, i: int) -> dict[str, Any]:
+        c = self.columns
+        elevation = c.elevation[i]
+        time = c.time[i]
+        return {
+            "lat": c.lat[i],
+            "lon": c.lon[i],
+            "elevation": None if math.isnan(elevation) else elevation,
+            "time": (
+                None if math.isnan(time) else datetime.fromtimestamp(time, self._tz)
+            ),
+        }
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._point(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("point index out of range")
+        return self._point(index)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for i in range(len(self)):
+            yield self._point(i)
+
+
+def parse_gpx(file_path: str) -> dict[str, Any]:
+    try:
+        columns = parse_gpx_columns(file_path)
+    except (ET.ParseError, ValueError):
+        # Fall back to gpxpy for files the streaming parser cannot handle
+        # (malformed XML gpxpy tolerates, unusual timestamp formats, ...)
+        import gpxpy.gpx
+
+        try:
+            columns = parse_gpx_columns_gpxpy(file_path)
+        except gpxpy.gpx.GPXException as e:
+            # gpxpy exceptions can't be unpickled, which breaks the worker
+            # pool when one is raised in a worker process
+            raise ValueError(f"Invalid GPX file: {e}") from e
+
+    if not len(columns):
+        raise ValueError("No GPS points found in GPX file")
+
+    return {"points": TrackPoints(columns), "name": columns.name}
+
+
+def parse_gpx_columns(file_path: str) -> TrackColumns:
+    columns = TrackColumns()
+    has_tracks = False
+    stack: list[ET.Element] = []
+    point: dict[str, Any] | None = None
+    tz_offset: int | None = None
+
+    for event, elem in ET.iterparse(file_path, events=("start", "end")):
+        tag = _local_name(elem.tag)
+
+        if event == "start":
+            if tag == "trkpt" and stack and _local_name(stack[-1].tag) == "trkseg":
+                point = {}
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        parent_tag = _local_name(stack[-1].tag) if stack else None
+
+        if tag == "trkpt" and point is not None:
+            lat = elem.get("lat")
+            lon = elem.get("lon")
+            if lat is None or lon is None:
+                raise ValueError("Track point without coordinates")
+            time = point.get("time")
+            if time is not None and tz_offset is None:
+                offset = time.utcoffset()
+                tz_offset = int(offset.total_seconds()) if offset else 0
+            columns.append(
+                float(lat),
+                float(lon),
+                point.get("elevation", NAN),
+                NAN if time is None else _timestamp(time),
+            )
+            point = None
+        elif point is not None and tag == "ele" and parent_tag == "trkpt":
+            point["elevation"] = _parse_float(elem.text)
+        elif point is not None and tag == "time" and parent_tag == "trkpt":
+            point["time"] = _parse_time(elem.text)
+        elif tag == "name" and parent_tag == "trk" and not has_tracks:
+            columns.name = (elem.text or "").strip() or None
+        elif tag == "trk":
+            has_tracks = True
+
+        # Detach finished points and top-level elements so the tree never
+        # holds more than the point currently being parsed
+        if stack and (tag == "trkpt" or len(stack) == 1):
+            stack[-1].remove(elem)
+
+    if not has_tracks:
+        columns.name = "Unknown"
+    columns.tz_offset = tz_offset or 0
+    return columns
+
+
+def parse_gpx_columns_gpxpy(file_path: str) -> TrackColumns:
+    # gpxpy is only needed for files the streaming parser rejects
+    import gpxpy
+
     with open(file_path) as f:
         gpx = gpxpy.parse(f)
 
-    points = []
+    columns = TrackColumns(name=gpx.tracks[0].name if gpx.tracks else "Unknown")
+    tz_offset = None
     for track in gpx.tracks:
         for segment in track.segments:
             for point in segment.points:
-                points.append(
-                    {
-                        "lat": point.latitude,
-                        "lon": point.longitude,
-                        "elevation": point.elevation,
-                        "time": point.time,
-                    }
+                if point.time is not None and tz_offset is None:
+                    offset = point.time.utcoffset()
+                    tz_offset = int(offset.total_seconds()) if offset else 0
+                columns.append(
+                    point.latitude,
+                    point.longitude,
+                    NAN if point.elevation is None else point.elevation,
+                    NAN if point.time is None else _timestamp(point.time),
                 )
+    columns.tz_offset = tz_offset or 0
+    return columns
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_float(text: str | None) -> float:
+    if text is None or not text.strip():
+        return NAN
+    return float(text)
+
+
+def _parse_time(text: str | None) -> datetime | None:
+    if text is None or not text.strip():
+        return None
+    # datetime.fromisoformat handles "Z" and fractional seconds since 3.11
+    return datetime.fromisoformat(text.strip())
 
-    if not points:
-        raise ValueError("No GPS points found in GPX file")
 
-    return {"points": points, "name": gpx.tracks[0].name if gpx.tracks else "Unknown"}
+def _timestamp(value: datetime) -> float:
+    # gpxpy returns naive datetimes when the file has no zone designator;
+    # GPX times are UTC by spec
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.timestamp()
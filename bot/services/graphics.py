@@ -1,75 +1,142 @@
 import math
 import os
+import threading
 from datetime import datetime
 
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
+# matplotlib is imported where it is used: only worker processes render, and
+# the bot process imports this module just for RENDERER_VERSION
+
+# Bump whenever the output changes so cached images are re-rendered
+RENDERER_VERSION = 2
+
+SPEED_COLOR = "#3498db"
+ELEVATION_COLOR = "#27ae60"
+
+_configure_lock = threading.Lock()
+_configured = False
+# Figures are not thread-safe, so every thread keeps its own templates
+_templates = threading.local()
+
+
+def configure_matplotlib():
+    # rcParams are process-global: set them once per worker process
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        import matplotlib
+
+        matplotlib.rcParams["font.family"] = "DejaVu Sans"
+        _configured = True
+
+
+class InfographicTemplate:
+    def __init__(self, has_elevation: bool):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        configure_matplotlib()
+        self.has_elevation = has_elevation
+
+        # Adjust figure layout based on whether elevation data exists
+        if has_elevation:
+            self.figure = Figure(figsize=(10, 8))
+            self.speed_ax, self.elevation_ax = self.figure.subplots(2, 1)
+        else:
+            self.figure = Figure(figsize=(10, 5))
+            self.speed_ax = self.figure.subplots(1, 1)
+            self.elevation_ax = None
+        FigureCanvasAgg(self.figure)
+
+        self.speed_ax.set_title("Скорость", fontsize=12, fontweight="bold")
+        self.speed_ax.set_xlabel("Время (ч)")
+        self.speed_ax.set_ylabel("км/ч")
+        self.speed_ax.grid(True, alpha=0.3)
+
+        if self.elevation_ax is not None:
+            self.elevation_ax.set_title("Высота", fontsize=12, fontweight="bold")
+            self.elevation_ax.set_xlabel("Расстояние (км)")
+            self.elevation_ax.set_ylabel("м")
+            self.elevation_ax.grid(True, alpha=0.3)
+
+        self.summary = self.figure.text(
+            0.5,
+            0.95,
+            "",
+            ha="center",
+            va="top",
+            fontsize=11,
+            bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.5),
+        )
 
-rcParams["font.family"] = "DejaVu Sans"
+    def _axes(self):
+        return [ax for ax in (self.speed_ax, self.elevation_ax) if ax is not None]
 
+    def _clear_data(self):
+        # Drop the previous render's curves but keep titles, labels and grid
+        for ax in self._axes():
+            for artist in [*ax.lines, *ax.collections]:
+                artist.remove()
+            ax.relim()
 
-def create_infographic(metrics: dict, output_path: str):
-    has_elevation = metrics.get("min_elevation") is not None
+    def render(self, metrics: dict, output_path: str, series: dict | None = None):
+        self._clear_data()
 
-    # Adjust figure layout based on whether elevation data exists
-    if has_elevation:
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
-    else:
-        fig, ax1 = plt.subplots(1, 1, figsize=(10, 5))
-
-    # --- Plot Speed ---
-    speed_data = generate_speed_data(metrics)
-    ax1.plot(speed_data["times"], speed_data["speeds"], color="#3498db", linewidth=2)
-    ax1.set_title("Скорость", fontsize=12, fontweight="bold")
-    ax1.set_ylabel("км/ч")
-    ax1.grid(True, alpha=0.3)
-    ax1.fill_between(
-        speed_data["times"], speed_data["speeds"], alpha=0.3, color="#3498db"
-    )
-
-    # --- Plot Elevation (if available) ---
-    if has_elevation:
-        elevation_data = generate_elevation_data(metrics)
-        ax2.plot(
-            elevation_data["distances"],
-            elevation_data["elevations"],
-            color="#27ae60",
-            linewidth=2,
+        speed_data = generate_speed_data(metrics, series)
+        self.speed_ax.plot(
+            speed_data["times"], speed_data["speeds"], color=SPEED_COLOR, linewidth=2
         )
-        ax2.set_title("Высота", fontsize=12, fontweight="bold")
-        ax2.set_xlabel("Расстояние (км)")
-        ax2.set_ylabel("м")
-        ax2.grid(True, alpha=0.3)
-        ax2.fill_between(
-            elevation_data["distances"],
-            elevation_data["elevations"],
-            alpha=0.3,
-            color="#27ae60",
+        self.speed_ax.fill_between(
+            speed_data["times"], speed_data["speeds"], alpha=0.3, color=SPEED_COLOR
         )
 
-    # --- Add Summary Text ---
-    fig.text(
-        0.5,
-        0.95,
-        get_summary_text(metrics),
-        ha="center",
-        va="top",
-        fontsize=11,
-        bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.5),
-    )
-
-    plt.tight_layout()
-    plt.subplots_adjust(top=0.85 if has_elevation else 0.8)
+        if self.elevation_ax is not None:
+            elevation_data = generate_elevation_data(metrics, series)
+            self.elevation_ax.plot(
+                elevation_data["distances"],
+                elevation_data["elevations"],
+                color=ELEVATION_COLOR,
+                linewidth=2,
+            )
+            self.elevation_ax.fill_between(
+                elevation_data["distances"],
+                elevation_data["elevations"],
+                alpha=0.3,
+                color=ELEVATION_COLOR,
+            )
+
+        self.summary.set_text(get_summary_text(metrics))
+
+        self.figure.tight_layout()
+        self.figure.subplots_adjust(top=0.85 if self.has_elevation else 0.8)
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        self.figure.savefig(output_path, dpi=150, bbox_inches="tight")
+
+
+def get_template(has_elevation: bool) -> InfographicTemplate:
+    cache = _templates.__dict__
+    template = cache.get(has_elevation)
+    if template is None:
+        template = cache[has_elevation] = InfographicTemplate(has_elevation)
+    return template
+
+
+def create_infographic(metrics: dict, output_path: str, series: dict | None = None):
+    # series: downsampled real track data from bot.services.series; without it
+    # (trips imported before series were stored) the curves are approximated
+    # from the summary metrics
+    has_elevation = metrics.get("min_elevation") is not None
+    get_template(has_elevation).render(metrics, output_path, series)
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    plt.savefig(output_path, dpi=150, bbox_inches="tight")
-    plt.close()
 
+def generate_speed_data(metrics, series=None):
+    if series is not None and len(series["speeds"]):
+        return {"times": series["speed_hours"], "speeds": series["speeds"]}
 
-def generate_speed_data(metrics):
     duration_hours = (metrics.get("duration") or 0) / 3600
     points = max(10, int(duration_hours * 2))
-    times = list(range(points))
+    times = [i * duration_hours / points for i in range(points)]
     avg_speed = metrics.get("avg_speed") or 0
     max_speed = metrics.get("max_speed") or 0
     # Ensure max_speed is not less than avg_speed to avoid negative values
@@ -82,7 +149,10 @@ def generate_speed_data(metrics):
     return {"times": times, "speeds": speeds}
 
 
-def generate_elevation_data(metrics):
+def generate_elevation_data(metrics, series=None):
+    if series is not None and len(series["elevations"]):
+        return {"distances": series["elevation_km"], "elevations": series["elevations"]}
+
     distance_km = (metrics.get("distance") or 0) / 1000
     points = max(20, int(distance_km * 10))
     distances = [i * distance_km / points for i in range(points)]
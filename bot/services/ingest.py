@@ -0,0 +1,85 @@
+import logging
+import os
+from collections.abc import Sequence
+from typing import Any
+
+from bot.services.logs import span
+
+logger = logging.getLogger(__name__)
+
+# Everything in this module runs inside worker processes: arguments and
+# return values must be picklable and small (no point lists). The bot process
+# imports it only to reference the functions, so numpy, matplotlib and the
+# rest are imported inside them.
+
+
+def warm_up():
+    # Pay for the heavy imports up front; building the templates also loads
+    # the font cache so the first real render doesn't pay for it
+    import gpxpy  # noqa: F401
+
+    from bot.services.calculator import calculate_metrics  # noqa: F401
+    from bot.services.graphics import get_template
+    from bot.services.series import build_series  # noqa: F401
+
+    for has_elevation in (True, False):
+        get_template(has_elevation)
+
+
+def process_gpx(file_path: str) -> tuple[dict[str, Any], bytes, dict[str, float]]:
+    # Returns the metrics, the packed plot series for the trip and how long
+    # each stage took (reported to the parent's metrics)
+    from bot.services.calculator import calculate_metrics
+    from bot.services.gpx_parser import parse_gpx
+    from bot.services.series import build_series, pack_series
+    from bot.services.track_store import track_path, write_track
+
+    file_name = os.path.basename(file_path)
+    with span(logger, "parse", file=file_name) as parse:
+        points = parse_gpx(file_path)["points"]
+        parse.set(track=points)
+    with span(logger, "compute", file=file_name) as compute:
+        metrics = calculate_metrics(points)
+        series = pack_series(build_series(points))
+        compute.set(series_bytes=len(series))
+    # Written last, so a rejected track leaves no binary copy behind
+    with span(logger, "store", file=file_name) as store:
+        write_track(points.columns, track_path(file_path))
+    return metrics, series, {s.name: s.elapsed for s in (parse, compute, store)}
+
+
+def load_track(gpx_path: str) -> Sequence[dict[str, Any]]:
+    # Points from the binary store; tracks ingested before it existed are
+    # parsed once and stored on the way
+    from bot.services.gpx_parser import parse_gpx
+    from bot.services.track_store import open_track, track_path, write_track
+
+    stored = open_track(track_path(gpx_path))
+    if stored is not None:
+        return stored
+    points = parse_gpx(gpx_path)["points"]
+    write_track(points.columns, track_path(gpx_path))
+    return points
+
+
+def rebuild_series(gpx_path: str) -> bytes:
+    from bot.services.series import build_series, pack_series
+
+    return pack_series(build_series(load_track(gpx_path)))
+
+
+def render_graphic(
+    metrics: dict[str, Any], output_path: str, series: bytes | None = None
+) -> str:
+    from bot.services.graphics import create_infographic
+    from bot.services.series import unpack_series
+
+    # Render next to the target and rename, so readers never see a partial PNG
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.png"
+    try:
+        create_infographic(metrics, tmp_path, unpack_series(series) if series else None)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.types import FSInputFile
+
+import config
+from bot.models.ingest_job import IngestJob
+from bot.models.trip import Trip
+from bot.services.blob_store import (
+    content_path,
+    discard,
+    discard_gpx,
+    download_hashed,
+    store,
+)
+from bot.services.ingest import process_gpx
+from bot.services.logs import fields, span
+from bot.services.metrics import (
+    INGEST_JOB_WAIT_SECONDS,
+    INGEST_JOBS,
+    INGEST_STAGE_SECONDS,
+    observe_stages,
+)
+from bot.services.profiling import profiler
+from bot.services.render_cache import render_cache, trip_metrics
+from bot.services.telegram_files import sent_file_id
+from bot.services.worker_pool import ingest_pool
+
+logger = logging.getLogger(__name__)
+
+# GPX uploads are queued in the ingest_jobs table and worked off by
+# JOB_CONCURRENCY coroutines per process. A job runs its stages in order and
+# records each one as it completes, so after a restart it continues from
+# the next stage instead of starting over. Parsing, the metrics and the
+# database write are one stage: the plot series only exists in memory
+# between them, and the trip is written in a single transaction.
+#
+# Sending is at-least-once: a process that dies after the photo went out
+# but before the stage was recorded sends it again.
+
+# (stage, progress title), in order
+STAGES = (
+    ("download", "Загрузка файла"),
+    ("process", "Разбор трека и расчёт"),
+    ("render", "Построение графика"),
+    ("send", "Отправка"),
+)
+
+# A running job whose lease ran out belongs to a process that died; any
+# process may take it over. Renewed after every stage.
+JOB_LEASE = max(300.0, 3 * config.INGEST_TIMEOUT)
+# Queued jobs added by other processes are picked up within this many seconds
+POLL_INTERVAL = 5.0
+MAX_RETRY_DELAY = 600.0
+# Finished jobs are kept this long (seconds) for inspection
+JOB_HISTORY = 7 * 24 * 3600
+# How long stop() lets running jobs finish before cancelling them
+STOP_TIMEOUT = 5.0
+
+# Worth another attempt: the network, Telegram, a busy database, a worker
+# process that died (possibly killed with the pool because another job timed
+# out). A job that timed out itself is not retried: the same track would
+# only hang a fresh worker again.
+TRANSIENT_ERRORS = (
+    TelegramNetworkError,
+    TelegramServerError,
+    TelegramRetryAfter,
+    BrokenProcessPool,
+    sqlite3.OperationalError,
+    ConnectionError,
+)
+
+
+class DuplicateTrack(Exception):
+    def __init__(self, trip: Trip):
+        super().__init__(f"duplicate of trip {trip.id}")
+        self.trip = trip
+
+
+def trip_caption(metrics: dict[str, Any]) -> str:
+    caption = (
+        f"✅ Сплав добавлен!\n\n"
+        f"📊 {metrics['trip_date']} | {metrics['distance'] / 1000:.1f} км\n"
+    )
+
+    if metrics.get("avg_speed") is not None and metrics.get("max_speed") is not None:
+        caption += (
+            f"⚡ {metrics['avg_speed']:.1f} км/ч (средняя), "
+            f"{metrics['max_speed']:.1f} км/ч (макс)\n"
+        )
+    else:
+        caption += "⚡ Скорость: нет данных\n"
+
+    if (
+        metrics.get("min_elevation") is not None
+        and metrics.get("max_elevation") is not None
+    ):
+        caption += (
+            f"⛰️ {metrics['min_elevation']:.0f}-{metrics['max_elevation']:.0f} м, "
+            f"набор: {metrics['elevation_gain']:.0f} м\n"
+        )
+    else:
+        caption += "⛰️ Высота: нет данных\n"
+
+    caption += f"⏱️ {metrics['duration'] // 3600}ч {(metrics['duration'] % 3600) // 60}м"
+    return caption
+
+
+def format_progress(job: IngestJob, current: str | None, note: str = "") -> str:
+    done = True
+    lines = [f"⏳ Обработка {job.file_name or 'GPX файла'}", ""]
+    for stage, title in STAGES:
+        if stage == current:
+            done = False
+            lines.append(f"🔄 {title}...")
+        elif done:
+            lines.append(f"✅ {title}")
+        else:
+            lines.append(f"▫️ {title}")
+    if note:
+        lines += ["", note]
+    return "\n".join(lines)
+
+
+def pending_stages(job: IngestJob) -> list[str]:
+    names = [stage for stage, _ in STAGES]
+    if job.stage is None:
+        return names
+    return names[names.index(job.stage) + 1 :]
+
+
+def retry_delay(attempts: int, error: Exception) -> float:
+    # Exponential backoff with jitter, so jobs that failed together (e.g. on
+    # a Telegram outage) don't all come back at the same moment
+    delay = min(config.JOB_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    delay *= random.uniform(1.0, 1.5)
+    if isinstance(error, TelegramRetryAfter):
+        delay = max(delay, error.retry_after)
+    return delay
+
+
+class IngestQueue:
+    def __init__(self, concurrency: int):
+        self.concurrency = max(1, concurrency)
+        self.bot: Bot | None = None
+        self.owner = "main"
+        self._workers: list[asyncio.Task] = []
+        self._wake = asyncio.Event()
+        self._stopping = asyncio.Event()
+
+    async def enqueue(
+        self, chat_id: int, status_message_id: int, file_id: str, file_name: str
+    ) -> IngestJob:
+        job = await IngestJob.acreate(chat_id, status_message_id, file_id, file_name)
+        logger.info("Queued ingest job %d: %s", job.id, file_name)
+        self._wake.set()
+        return job
+
+    async def start(self, bot: Bot, owner: str):
+        # owner names this process (the webhook worker slot); jobs still
+        # marked as ours were interrupted by our own previous run
+        self.bot = bot
+        self.owner = owner
+        self._stopping.clear()
+        requeued = await IngestJob.arequeue_owned(owner)
+        if requeued:
+            logger.info("Resuming %d interrupted ingest jobs", requeued)
+        await IngestJob.apurge_finished(JOB_HISTORY)
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"ingest-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        if not self._workers:
+            return
+        self._stopping.set()
+        self._wake.set()
+        _, pending = await asyncio.wait(self._workers, timeout=STOP_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._workers = []
+        # Whatever was cancelled mid-stage resumes on the next start
+        requeued = await IngestJob.arequeue_owned(self.owner, graceful=True)
+        if requeued:
+            logger.info("Interrupted %d ingest jobs", requeued)
+
+    async def _work(self):
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                job = await IngestJob.aclaim(self.owner, JOB_LEASE)
+            except sqlite3.Error:
+                logger.exception("Failed to claim an ingest job")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL)
+                except TimeoutError:
+                    pass
+                continue
+            # Another job may be waiting behind this one
+            self._wake.set()
+            try:
+                await self._run(job)
+            except Exception:
+                # Recording the outcome failed; the lease expiring hands the
+                # job to another attempt
+                logger.exception("Ingest job %d: failed to record its state", job.id)
+
+    async def _run(self, job: IngestJob):
+        if job.attempts == 1:
+            INGEST_JOB_WAIT_SECONDS.observe(time.time() - job.created_at)
+
+        try:
+            for stage in pending_stages(job):
+                await self._edit(job, format_progress(job, stage))
+                await getattr(self, f"_{stage}")(job)
+                job.stage = stage
+                await job.asave_progress(JOB_LEASE)
+        except DuplicateTrack as e:
+            await job.afinish()
+            INGEST_JOBS.inc(result="duplicate")
+            await self._edit(
+                job,
+                f"Этот трек уже загружен: сплав #{e.trip.id} от {e.trip.trip_date}.",
+            )
+            return
+        except asyncio.CancelledError:
+            if self._stopping.is_set() or asyncio.current_task().cancelling():
+                # stop() requeues the job
+                raise
+            # Not cancelled ourselves: a future in the worker pool was
+            # cancelled when the pool was replaced under this job
+            await self._failed(job, BrokenProcessPool("worker pool restarted"))
+            return
+        except Exception as e:
+            await self._failed(job, e)
+            return
+
+        await job.afinish()
+        INGEST_JOBS.inc(result="done")
+        logger.info("Ingest job %d done, trip %d", job.id, job.payload["trip_id"])
+
+    async def _failed(self, job: IngestJob, error: Exception):
+        transient = isinstance(error, TRANSIENT_ERRORS)
+        if transient and job.attempts < config.JOB_MAX_ATTEMPTS:
+            delay = retry_delay(job.attempts, error)
+            await job.aretry(str(error), delay)
+            INGEST_JOBS.inc(result="retried")
+            logger.warning(
+                "Ingest job %d failed (attempt %d), retrying in %.0f s: %s",
+                job.id,
+                job.attempts,
+                delay,
+                error,
+            )
+            note = (
+                f"⚠️ Ошибка: {error}\nПовтор через {delay:.0f} с "
+                f"(попытка {job.attempts + 1} из {config.JOB_MAX_ATTEMPTS})"
+            )
+            await self._edit(job, format_progress(job, pending_stages(job)[0], note))
+            return
+
+        logger.error("Ingest job %d failed", job.id, exc_info=error)
+        await job.afail(str(error))
+        INGEST_JOBS.inc(result="failed")
+        await self._discard(job)
+        await self._edit(job, f"Ошибка при обработке GPX файла: {error}")
+
+    # Stages
+
+    async def _download(self, job: IngestJob):
+        # The hash is computed while downloading, so a track that is already
+        # in the database is rejected before any parsing or rendering
+        with span(logger, "download", INGEST_STAGE_SECONDS, file=job.file_name):
+            digest, tmp_path, _ = await download_hashed(
+                self.bot, job.file_id, config.TRACKS_DIR
+            )
+        existing = await Trip.aget_by_gpx_sha256(digest)
+        if existing:
+            logger.info("Duplicate GPX %s of trip %d", digest[:12], existing.id)
+            discard(tmp_path)
+            raise DuplicateTrack(existing)
+        job.payload["digest"] = digest
+        job.payload["file_path"] = store(
+            tmp_path, content_path(config.TRACKS_DIR, digest, ".gpx")
+        )
+
+    async def _process(self, job: IngestJob):
+        if not os.path.exists(job.payload["file_path"]):
+            # Discarded by a failed twin that checked before our download
+            # was recorded
+            await self._download(job)
+        digest = job.payload["digest"]
+        # Written by an earlier attempt that stopped before recording the
+        # stage
+        trip = await Trip.aget_by_gpx_sha256(digest)
+        if trip is None:
+            # Parsing and metrics run in the worker pool
+            with span(logger, "ingest", sha256=digest[:12]):
+                metrics, series, timings = await ingest_pool.run(
+                    process_gpx,
+                    job.payload["file_path"],
+                    profile=profiler.take("jobs"),
+                )
+            observe_stages(timings)
+            logger.info("Calculated metrics for %s: %s", digest[:12], fields(**metrics))
+
+            row = {
+                **metrics,
+                "gpx_path": job.payload["file_path"],
+                "gpx_sha256": digest,
+            }
+            try:
+                with span(logger, "db_write", INGEST_STAGE_SECONDS) as db_write:
+                    # The trip and its series in one transaction
+                    (trip_id,) = await Trip.acreate_many([row], [series])
+                    db_write.set(trip=trip_id)
+            except sqlite3.IntegrityError:
+                # An identical upload queued at the same time got there first
+                existing = await Trip.aget_by_gpx_sha256(digest)
+                if existing is None:
+                    raise
+                raise DuplicateTrack(existing) from None
+        else:
+            trip_id = trip.id
+        job.payload["trip_id"] = trip_id
+
+    async def _render(self, job: IngestJob):
+        trip = await self._trip(job)
+        with span(logger, "render", INGEST_STAGE_SECONDS, trip=trip.id):
+            await render_cache.get_or_render(trip)
+
+    async def _send(self, job: IngestJob):
+        trip = await self._trip(job)
+        # Normally a cache hit; re-renders if the image was evicted meanwhile
+        graphic_path = await render_cache.get_or_render(trip)
+        with span(logger, "send", INGEST_STAGE_SECONDS, trip=trip.id):
+            sent = await self.bot.send_photo(
+                job.chat_id,
+                FSInputFile(graphic_path),
+                caption=trip_caption(trip_metrics(trip)),
+            )
+        file_id = sent_file_id(sent)
+        if file_id:
+            await trip.aset_graphic_file_id(render_cache.key_for(trip), file_id)
+        # The photo replaces the progress message
+        if job.status_message_id:
+            try:
+                await self.bot.delete_message(job.chat_id, job.status_message_id)
+            except TelegramAPIError as e:
+                logger.debug("Failed to delete status message: %s", e)
+
+    # Helpers
+
+    async def _trip(self, job: IngestJob) -> Trip:
+        trip = await Trip.aget_by_id(job.payload["trip_id"])
+        if trip is None:
+            raise LookupError(f"сплав #{job.payload['trip_id']} был удалён")
+        return trip
+
+    async def _discard(self, job: IngestJob):
+        # The stored GPX of a job that failed for good, unless a trip or
+        # another job for the same content (an identical upload) still
+        # needs it
+        digest = job.payload.get("digest")
+        if not digest:
+            return
+        if await Trip.aget_by_gpx_sha256(digest) or await job.ahas_twin():
+            return
+        discard_gpx(job.payload["file_path"])
+
+    async def _edit(self, job: IngestJob, text: str):
+        if not job.status_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text, chat_id=job.chat_id, message_id=job.status_message_id
+            )
+        except TelegramAPIError as e:
+            # "message is not modified", deleted by the user and the like;
+            # progress is cosmetic
+            logger.debug("Failed to edit status of job %d: %s", job.id, e)
+
+
+ingest_queue = IngestQueue(config.JOB_CONCURRENCY)
@@ -0,0 +1,242 @@
+import logging
+import reprlib
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from typing import Any
+
+import config
+
+# Log helpers for the handlers and services. Messages use %-style arguments,
+# so nothing is formatted for records below the configured level; payloads
+# go through fields(), which renders summaries (a track becomes its point
+# count, bounding box and time span) with every value capped in size.
+
+FORMAT = "%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s"
+# Longest rendered value in fields(); whole messages are capped by config
+MAX_VALUE_CHARS = 200
+SAMPLE_INTERVAL = 60.0
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def _is_track(value: Any) -> bool:
+    # TrackPoints, StoredTrack and bare TrackColumns, without importing them
+    # (StoredTrack needs numpy)
+    return (
+        hasattr(value, "columns")
+        or hasattr(value, "arrays")
+        or (hasattr(value, "lat") and hasattr(value, "tz_offset"))
+    )
+
+
+def _known_range(values) -> tuple | None:
+    if hasattr(values, "tolist"):
+        values = values.tolist()
+    known = [v for v in values if v == v]  # NaN != NaN
+    return (min(known), max(known)) if known else None
+
+
+def summarize_track(track: Any) -> str:
+    if hasattr(track, "arrays"):
+        lat, lon, _, times = track.arrays()
+    else:
+        columns = getattr(track, "columns", track)
+        lat, lon, times = columns.lat, columns.lon, columns.time
+    n = len(lat)
+    if not n:
+        return "<track n=0>"
+
+    lat_range = _known_range(lat)
+    lon_range = _known_range(lon)
+    text = (
+        f"<track n={n} bbox=({lat_range[0]:.5f},{lon_range[0]:.5f})"
+        f"-({lat_range[1]:.5f},{lon_range[1]:.5f})"
+    )
+    time_range = _known_range(times)
+    if time_range:
+        start = datetime.fromtimestamp(time_range[0], UTC)
+        seconds = int(time_range[1] - time_range[0])
+        text += (
+            f" start={start:%Y-%m-%dT%H:%M:%SZ}"
+            f" span={seconds // 3600}h{seconds % 3600 // 60:02d}m"
+        )
+    return text + ">"
+
+
+class _SummaryRepr(reprlib.Repr):
+    def __init__(self):
+        super().__init__()
+        self.maxlevel = 3
+        self.maxdict = 12
+        self.maxlist = self.maxtuple = self.maxset = 8
+        self.maxstring = self.maxother = MAX_VALUE_CHARS
+
+    def repr1(self, x, level):
+        if _is_track(x):
+            return summarize_track(x)
+        return super().repr1(x, level)
+
+    def repr_float(self, x, level):
+        return f"{x:.6g}"
+
+    def repr_bytes(self, x, level):
+        return f"<{len(x)} bytes>"
+
+
+_summary_repr = _SummaryRepr()
+
+
+def summarize(value: Any) -> str:
+    if isinstance(value, str):
+        return value if len(value) <= MAX_VALUE_CHARS else _summary_repr.repr(value)
+    text = _summary_repr.repr(value)
+    if len(text) > MAX_VALUE_CHARS:
+        text = text[:MAX_VALUE_CHARS] + "…"
+    return text
+
+
+class fields:
+    """``key=value`` pairs rendered only if the record is emitted.
+
+    ``logger.info("Parsed %s", fields(track=points, file=name))``
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, **values: Any):
+        self.values = values
+
+    def __str__(self) -> str:
+        return " ".join(f"{key}={summarize(v)}" for key, v in self.values.items())
+
+
+class Span:
+    def __init__(self, name: str, values: dict[str, Any]):
+        self.name = name
+        self.fields = fields(**values)
+        self.elapsed = 0.0
+
+    def set(self, **values: Any):
+        # Attach results known only inside the block (e.g. the parsed track)
+        self.fields.values.update(values)
+
+
+@contextmanager
+def span(
+    logger: logging.Logger,
+    name: str,
+    metric=None,
+    level: int = logging.DEBUG,
+    **values: Any,
+) -> Iterator[Span]:
+    """Time a pipeline stage and log its duration when it ends.
+
+    With ``metric`` (a histogram labelled by ``stage``) the duration is
+    observed there as well. Failures are logged at WARNING with the time
+    spent before the error and re-raised.
+    """
+    current = Span(name, values)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.elapsed = time.perf_counter() - started
+        logger.warning(
+            "%s failed after %.1f ms: %r %s",
+            name,
+            current.elapsed * 1000,
+            e,
+            current.fields,
+        )
+        raise
+    current.elapsed = time.perf_counter() - started
+    if metric is not None:
+        metric.observe(current.elapsed, stage=name)
+    # The stage is part of the template so each one is sampled on its own
+    logger.log(
+        level,
+        name.replace("%", "%%") + " done in %.1f ms %s",
+        current.elapsed * 1000,
+        current.fields,
+    )
+
+
+class SampleFilter(logging.Filter):
+    """Let at most ``burst`` records per message template through per minute.
+
+    Warnings and errors always pass. The first record after a quiet period
+    carries the number of similar records that were dropped.
+    """
+
+    def __init__(self, burst: int, interval: float = SAMPLE_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.burst <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if len(self._windows) > 1000:
+                    self._windows.clear()
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} similar suppressed]"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class CapFilter(logging.Filter):
+    # Formats the message once and truncates it; the formatter reuses it
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            extra = len(message) - self.max_chars
+            message = f"{message[: self.max_chars]}… [+{extra} chars]"
+        record.msg = message
+        record.args = None
+        return True
+
+
+def setup_logging():
+    # Called in the bot process and in every ingest worker
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(FORMAT))
+        handler.addFilter(SampleFilter(config.LOG_SAMPLE_BURST))
+        handler.addFilter(CapFilter(config.LOG_MAX_CHARS))
+        root = logging.getLogger()
+        root.addHandler(handler)
+        # DEBUG is only for our own loggers; matplotlib, asyncio and aiogram
+        # stay at INFO
+        level = logging.getLevelNamesMapping().get(config.LOG_LEVEL)
+        if level is None:
+            level = logging.INFO
+            logging.getLogger(__name__).warning(
+                "Unknown LOG_LEVEL %r, using INFO", config.LOG_LEVEL
+            )
+        root.setLevel(max(level, logging.INFO))
+        logging.getLogger("bot").setLevel(level)
+        _configured = True
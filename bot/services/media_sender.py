@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import logging
+import os
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest
+
+import config
+from bot.models.trip import Media
+from bot.services.telegram_files import send_cached, sent_file_id
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+# sendMediaGroup accepts 2-10 items; photos and videos may be mixed
+ALBUM_SIZE = 10
+
+
+async def send_media_albums(
+    bot: Bot,
+    chat_id: int,
+    media_list: list[Media],
+    concurrency: int = config.MEDIA_ALBUM_CONCURRENCY,
+) -> int:
+    # Sends the media as albums, several albums in flight at once (so albums
+    # may arrive out of order). Returns how many items could not be sent.
+    sendable = [
+        m
+        for m in media_list
+        if m.media_type in ("photo", "video")
+        and (m.file_id or os.path.exists(m.file_path))
+    ]
+    failed = len(media_list) - len(sendable)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def send(album: list[Media]) -> int:
+        async with semaphore:
+            try:
+                await _send_album(bot, chat_id, album)
+                return 0
+            except Exception as e:
+                logger.error("Error sending album of %d media: %s", len(album), e)
+                return len(album)
+
+    albums = [sendable[i : i + ALBUM_SIZE] for i in range(0, len(sendable), ALBUM_SIZE)]
+    results = await asyncio.gather(*(send(album) for album in albums))
+    return failed + sum(results)
+
+
+async def _send_album(bot: Bot, chat_id: int, album: list[Media]):
+    if len(album) == 1:
+        # A media group needs at least two items
+        item = album[0]
+        method = bot.send_photo if item.media_type == "photo" else bot.send_video
+        _, new_file_id = await send_cached(
+            functools.partial(method, chat_id), item.file_id, item.file_path
+        )
+        if new_file_id:
+            await item.aset_file_id(new_file_id)
+        return
+
+    try:
+        messages = await bot.send_media_group(
+            chat_id, [_input_media(item, use_file_id=True) for item in album]
+        )
+    except TelegramBadRequest as e:
+        if not any(item.file_id for item in album):
+            raise
+        # One stale file_id fails the whole group: upload everything instead
+        logger.warning("Cached file_id rejected in album, re-uploading: %s", e)
+        messages = await bot.send_media_group(
+            chat_id, [_input_media(item, use_file_id=False) for item in album]
+        )
+
+    updates = []
+    for item, message in zip(album, messages):
+        new_file_id = sent_file_id(message)
+        if new_file_id and new_file_id != item.file_id:
+            updates.append(functools.partial(item.set_file_id, new_file_id))
+    if updates:
+        await db.batch(*updates)
+
+
+def _input_media(
+    item: Media, use_file_id: bool
+) -> types.InputMediaPhoto | types.InputMediaVideo:
+    source: str | types.FSInputFile = (
+        item.file_id
+        if use_file_id and item.file_id
+        else types.FSInputFile(item.file_path)
+    )
+
+    if item.media_type == "photo":
+        return types.InputMediaPhoto(media=source)
+    return types.InputMediaVideo(media=source)
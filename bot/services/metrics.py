@@ -0,0 +1,250 @@
+import bisect
+import math
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+
+# In-process metrics in the Prometheus text format. Values are updated from
+# the event loop only, so there is no locking.
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        """(sample name, formatted labels, value) for every series."""
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        self.values[self._key(labels)] = value
+
+
+class CallbackMetric(Metric):
+    # Values read from somewhere else at scrape time, e.g. a plain dict of
+    # counters kept by another component
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], dict[LabelValues, float]],
+        type: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def samples(self):
+        for key, value in sorted(self.callback().items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (non-cumulative) + overflow, sum]
+        self.values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                labels = _format_labels(self.labelnames, key, le)
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, total[0]
+            yield f"{self.name}_count", labels, cumulative
+
+    def quantile(self, key: LabelValues, q: float) -> float | None:
+        # Upper bound of the bucket holding the q-th observation
+        counts, _ = self.values.get(key, ([], None))
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return math.inf
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), **kw
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kw))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list[str]:
+        # Short human-readable digest for the log: histograms as
+        # count / mean / p95 per label set, counters and gauges as is
+        lines = []
+        for metric in self.metrics:
+            if isinstance(metric, Histogram):
+                for key, (counts, total) in sorted(metric.values.items()):
+                    count = sum(counts)
+                    p95 = metric.quantile(key, 0.95)
+                    lines.append(
+                        f"{metric.name}{_format_labels(metric.labelnames, key)} "
+                        f"n={count} mean={total[0] / count * 1000:.0f}ms "
+                        f"p95<={_format_value(p95)}s"
+                    )
+            else:
+                for name, labels, value in metric.samples():
+                    if value:
+                        lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram(
+    "geobot_handler_seconds",
+    "Handler latency by router and handler",
+    ("router", "handler"),
+)
+HANDLER_ERRORS = registry.counter(
+    "geobot_handler_errors_total",
+    "Handlers that raised, by router and handler",
+    ("router", "handler"),
+)
+HANDLERS_IN_FLIGHT = registry.gauge(
+    "geobot_handlers_in_flight", "Handlers currently running, by router", ("router",)
+)
+UPDATE_SECONDS = registry.histogram(
+    "geobot_update_seconds",
+    "Time to process an incoming update, by update type",
+    ("type",),
+)
+UPDATES_IN_FLIGHT = registry.gauge(
+    "geobot_updates_in_flight", "Updates currently being processed"
+)
+UPDATE_ERRORS = registry.counter(
+    "geobot_update_errors_total", "Updates whose processing raised", ("type",)
+)
+INGEST_STAGE_SECONDS = registry.histogram(
+    "geobot_ingest_stage_seconds",
+    "Time spent in each GPX ingest stage",
+    ("stage",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+INGEST_JOBS = registry.counter(
+    "geobot_ingest_jobs_total",
+    "Ingest job attempts by result: done, duplicate, retried, failed",
+    ("result",),
+)
+INGEST_JOB_WAIT_SECONDS = registry.histogram(
+    "geobot_ingest_job_wait_seconds",
+    "Time from a GPX upload until its ingest job starts",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+
+def observe_stages(timings: dict[str, float]):
+    # Stage timings measured inside worker processes
+    for stage, seconds in timings.items():
+        INGEST_STAGE_SECONDS.observe(seconds, stage=stage)
@@ -0,0 +1,212 @@
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Opt-in profiling of ingest jobs (inside the worker process) and handlers
+# (on the event loop). Every profiled call leaves two files in PROFILES_DIR:
+#
+#   <time>-<name>.pstats     cProfile data: python -m pstats, snakeviz, ...
+#   <time>-<name>.collapsed  sampled stacks, one "frame;frame;... count" line
+#                            per stack, for flamegraph.pl / speedscope
+#
+# and a top-TOP_N summary is sent to the admin chat.
+
+TARGETS = ("jobs", "handlers")
+TOP_N = 20
+SAMPLE_INTERVAL = 0.005
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread.
+
+    The GIL limits the effective rate to the interpreter switch interval
+    (5 ms by default), which is plenty for jobs that take seconds.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+@dataclass
+class ProfileReport:
+    name: str
+    elapsed: float
+    pstats_path: str
+    stacks_path: str
+    samples: int
+    # (self s, cumulative s, calls, "file:line(function)") by self time
+    top: list[tuple[float, float, int, str]] = field(default_factory=list)
+
+    def format(self) -> str:
+        lines = [
+            f"🔬 Профиль {self.name}: {self.elapsed * 1000:.0f} мс, "
+            f"{self.samples} сэмплов",
+            f"{os.path.basename(self.pstats_path)}",
+            "",
+            "   self ms    cum ms   calls  function",
+        ]
+        for own, cumulative, calls, where in self.top:
+            lines.append(
+                f"{own * 1000:9.1f} {cumulative * 1000:9.1f} {calls:7d}  {where[-60:]}"
+            )
+        return "\n".join(lines)
+
+
+def _top_functions(stats: pstats.Stats, n: int) -> list[tuple[float, float, int, str]]:
+    rows = []
+    for (filename, line, function), entry in stats.stats.items():
+        _, calls, own, cumulative, _ = entry
+        if filename == "~":
+            where = function  # built-in: "<method 'append' of 'list' objects>"
+        else:
+            where = f"{os.path.basename(filename)}:{line}({function})"
+        rows.append((own, cumulative, calls, where))
+    rows.sort(reverse=True)
+    return rows[:n]
+
+
+class Profile:
+    """cProfile plus a stack sampler around a block on the current thread.
+
+    ``save()`` writes both files after the block and returns the report;
+    it blocks, so callers on the event loop run it in a thread.
+    """
+
+    # cProfile can't nest: a second profiler on the same thread would
+    # silently take over from the first
+    _active = threading.local()
+
+    def __init__(self, name: str, directory: str = config.PROFILES_DIR):
+        self.name = name
+        self.directory = directory
+        self.report: ProfileReport | None = None
+
+    @classmethod
+    def is_active(cls) -> bool:
+        return getattr(cls._active, "value", False)
+
+    def __enter__(self) -> "Profile":
+        Profile._active.value = True
+        self._profiler = cProfile.Profile()
+        self._sampler = StackSampler(threading.get_ident())
+        self._started = time.perf_counter()
+        self._sampler.start()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profiler.disable()
+        self._elapsed = time.perf_counter() - self._started
+        self._sampler.stop()
+        Profile._active.value = False
+
+    def save(self) -> ProfileReport:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base = os.path.join(self.directory, f"{stamp}-{self.name}")
+        stats = pstats.Stats(self._profiler)
+        stats.dump_stats(f"{base}.pstats")
+        self._sampler.write(f"{base}.collapsed")
+        self.report = ProfileReport(
+            name=self.name,
+            elapsed=self._elapsed,
+            pstats_path=f"{base}.pstats",
+            stacks_path=f"{base}.collapsed",
+            samples=sum(self._sampler.stacks.values()),
+            top=_top_functions(stats, TOP_N),
+        )
+        return self.report
+
+
+def run_profiled(func: Callable[..., Any], *args: Any) -> tuple[Any, ProfileReport]:
+    # Runs in the worker process; the report travels back with the result
+    with Profile(func.__name__) as profile:
+        result = func(*args)
+    return result, profile.save()
+
+
+class Profiler:
+    """How many of the next jobs / handler calls to profile, and where to
+    send the reports. Armed from the environment at start-up or by /profile.
+    """
+
+    def __init__(self, jobs: int = 0, handlers: int = 0):
+        self.remaining: dict[str, int] = {"jobs": jobs, "handlers": handlers}
+        self.chat_id = config.ADMIN_ID
+        self.bot = None
+
+    def arm(self, target: str, count: int, chat_id: int | None = None):
+        self.remaining[target] = max(0, count)
+        if chat_id is not None:
+            self.chat_id = chat_id
+
+    def disarm(self):
+        for target in self.remaining:
+            self.remaining[target] = 0
+
+    def take(self, target: str) -> bool:
+        if self.remaining[target] <= 0:
+            return False
+        self.remaining[target] -= 1
+        return True
+
+    async def publish(self, report: ProfileReport):
+        logger.info(
+            "Profile %s: %.0f ms, written to %s",
+            report.name,
+            report.elapsed * 1000,
+            report.pstats_path,
+        )
+        if self.bot is None or not self.chat_id:
+            return
+        try:
+            await self.bot.send_message(self.chat_id, report.format())
+        except Exception as e:
+            logger.warning("Failed to send profile report: %s", e)
+
+
+profiler = Profiler(jobs=config.PROFILE_JOBS, handlers=config.PROFILE_HANDLERS)
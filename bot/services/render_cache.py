@@ -0,0 +1,133 @@
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+from typing import Any
+
+import config
+from bot.models.trip import Trip
+from bot.services.graphics import RENDERER_VERSION
+from bot.services.ingest import rebuild_series, render_graphic
+from bot.services.worker_pool import ingest_pool
+
+logger = logging.getLogger(__name__)
+
+METRIC_FIELDS = (
+    "trip_date",
+    "distance",
+    "duration",
+    "avg_speed",
+    "max_speed",
+    "min_elevation",
+    "max_elevation",
+    "elevation_gain",
+)
+
+
+def trip_metrics(trip: Trip) -> dict[str, Any]:
+    return {field: getattr(trip, field) for field in METRIC_FIELDS}
+
+
+def cache_key(metrics: dict[str, Any]) -> str:
+    payload = json.dumps(
+        {"metrics": metrics, "renderer": RENDERER_VERSION},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class RenderCache:
+    # Images are named trip_{id}_{key}.png: a new key for the same trip means
+    # the metrics or the renderer changed, and the old image is stale
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._rendering: dict[str, asyncio.Task] = {}
+
+    def key_for(self, trip: Trip) -> str:
+        return cache_key(trip_metrics(trip))
+
+    def path_for(self, trip: Trip) -> str:
+        return os.path.join(self.directory, f"trip_{trip.id}_{self.key_for(trip)}.png")
+
+    def lookup(self, trip: Trip) -> str | None:
+        path = self.path_for(trip)
+        try:
+            # mtime doubles as the last access time for LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    async def get_or_render(self, trip: Trip) -> str:
+        path = self.lookup(trip)
+        if path is not None:
+            return path
+
+        path = self.path_for(trip)
+        # Concurrent views of the same trip share a single render
+        task = self._rendering.get(path)
+        if task is None:
+            task = asyncio.ensure_future(self._render(trip, path))
+            self._rendering[path] = task
+            task.add_done_callback(lambda _: self._rendering.pop(path, None))
+        return await asyncio.shield(task)
+
+    async def _render(self, trip: Trip, path: str) -> str:
+        series = await trip.aget_series()
+        if series is None and trip.gpx_path and os.path.exists(trip.gpx_path):
+            # Trips from before series were stored: build them once from the
+            # track instead of falling back to synthetic curves
+            series = await ingest_pool.run(rebuild_series, trip.gpx_path)
+            await trip.asave_series(series)
+        await ingest_pool.run(render_graphic, trip_metrics(trip), path, series)
+        # Directory scans and deletions block; keep them off the event loop
+        await asyncio.to_thread(self._cleanup, trip.id, path)
+        return path
+
+    def _cleanup(self, trip_id: int, keep: str):
+        self._remove_stale(trip_id, keep)
+        self.evict()
+
+    async def invalidate(self, trip_id: int):
+        await asyncio.to_thread(self._remove_stale, trip_id, None)
+
+    def _remove_stale(self, trip_id: int, keep: str | None):
+        for path in glob.glob(os.path.join(self.directory, f"trip_{trip_id}_*.png")):
+            if path != keep:
+                _remove(path)
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".png") or ".tmp" in entry.name:
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+            logger.info("Evicted cached graphic %s", path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+render_cache = RenderCache(
+    config.GRAPHICS_DIR, max_bytes=config.GRAPHICS_CACHE_MAX_MB * 1024 * 1024
+)
@@ -0,0 +1,95 @@
+import io
+from collections.abc import Sequence
+from typing import Any
+
+import numpy as np
+
+from bot.services.calculator import haversine_distances, points_as_arrays
+
+# Plots never need more points than this, however long the raw track is
+SERIES_POINTS = 1000
+
+
+def build_series(
+    points: Sequence[dict[str, Any]], budget: int = SERIES_POINTS
+) -> dict[str, np.ndarray]:
+    lat, lon, elevation, time = points_as_arrays(points)
+    distances = haversine_distances(lat, lon)
+    cumulative_km = np.concatenate(([0.0], np.cumsum(distances))) / 1000
+
+    # Speed of each timed segment, plotted at the segment end in hours
+    # since the first timestamp
+    time_diffs = np.diff(time)
+    with np.errstate(invalid="ignore"):
+        timed = time_diffs > 0
+    speeds = (distances[timed] / 1000) / (time_diffs[timed] / 3600)
+    known_times = time[~np.isnan(time)]
+    start = known_times[0] if known_times.size else 0.0
+    speed_hours = (time[1:][timed] - start) / 3600
+
+    has_elevation = ~np.isnan(elevation)
+    elevation_km = cumulative_km[has_elevation]
+    elevation = elevation[has_elevation]
+
+    # 1 s GPS speeds are mostly jitter; average over roughly one output bucket
+    # so the downsampled curve shows the pace rather than the noise
+    speeds = moving_average(speeds, max(1, len(speeds) // budget))
+
+    speed_idx = lttb(speed_hours, speeds, budget)
+    elevation_idx = lttb(elevation_km, elevation, budget)
+    return {
+        "speed_hours": speed_hours[speed_idx],
+        "speeds": speeds[speed_idx],
+        "elevation_km": elevation_km[elevation_idx],
+        "elevations": elevation[elevation_idx],
+    }
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    if window <= 1 or len(values) == 0:
+        return values
+    kernel = np.ones(window)
+    # Normalise by the actual number of samples so the edges aren't pulled down
+    counts = np.convolve(np.ones(len(values)), kernel, mode="same")
+    return np.convolve(values, kernel, mode="same") / counts
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: indices of `threshold` points that keep
+    # the visual shape (peaks included) of the original series
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        area = np.abs(
+            (x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def pack_series(series: dict[str, np.ndarray]) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, **{k: v.astype(np.float32) for k, v in series.items()})
+    return buffer.getvalue()
+
+
+def unpack_series(data: bytes) -> dict[str, np.ndarray]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        return {k: archive[k] for k in archive.files}
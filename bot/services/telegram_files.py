@@ -0,0 +1,44 @@
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+PathSource = str | Callable[[], Awaitable[str | None]]
+
+
+def sent_file_id(message: types.Message) -> str | None:
+    if message.photo:
+        # Largest size; Telegram derives the thumbnails itself
+        return message.photo[-1].file_id
+    if message.video:
+        return message.video.file_id
+    if message.document:
+        return message.document.file_id
+    return None
+
+
+async def send_cached(
+    send: Callable[..., Awaitable[types.Message]],
+    file_id: str | None,
+    source: PathSource,
+    **kwargs: Any,
+) -> tuple[types.Message | None, str | None]:
+    # Sends by cached file_id when there is one, otherwise (or when Telegram
+    # rejects a stale id) uploads the local file. Returns the sent message
+    # and, if an upload happened, the new file_id to store. source is the
+    # local path, or an async callable producing it only when needed.
+    if file_id:
+        try:
+            return await send(file_id, **kwargs), None
+        except TelegramBadRequest as e:
+            logger.warning("Cached file_id rejected, re-uploading: %s", e)
+
+    path = source if isinstance(source, str) else await source()
+    if path is None:
+        return None, None
+    message = await send(types.FSInputFile(path), **kwargs)
+    return message, sent_file_id(message)
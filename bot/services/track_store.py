@@ -0,0 +1,182 @@
+import mmap
+import os
+import struct
+from collections.abc import Iterator, Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import numpy as np
+
+from bot.services.gpx_parser import TrackColumns
+
+# Binary track file (<sha256>.trk next to the GPX), little-endian:
+#
+#   header   magic "GTRK", version u16, flags u16, point count u32,
+#            start time f64 (epoch s), seconds per time tick f64,
+#            UTC offset i32, name length u16, name (UTF-8), zero padding
+#            to a multiple of 4 bytes
+#   lat      int32[n]    degrees * 1e7 (~1 cm)
+#   lon      int32[n]    degrees * 1e7
+#   ele      float32[n]  metres, NaN = missing
+#   time     uint32[n]   ticks since start time, 0xFFFFFFFF = missing
+#
+# 16 bytes per point against roughly 150 for GPX XML. Values are stored
+# absolute rather than delta-encoded so every column maps straight onto a
+# numpy view of the file.
+MAGIC = b"GTRK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIddiH")
+FLAG_ELEVATION = 1
+FLAG_TIME = 2
+COORD_SCALE = 10_000_000
+TIME_MISSING = 0xFFFFFFFF
+TRACK_SUFFIX = ".trk"
+
+
+def track_path(gpx_path: str) -> str:
+    return os.path.splitext(gpx_path)[0] + TRACK_SUFFIX
+
+
+def write_track(columns: TrackColumns, path: str):
+    n = len(columns)
+    lat = np.frombuffer(columns.lat, dtype=np.float64)
+    lon = np.frombuffer(columns.lon, dtype=np.float64)
+    elevation = np.frombuffer(columns.elevation, dtype=np.float64)
+    time = np.frombuffer(columns.time, dtype=np.float64)
+
+    known_time = ~np.isnan(time)
+    start = float(time[known_time].min()) if known_time.any() else 0.0
+    span = float(time[known_time].max()) - start if known_time.any() else 0.0
+    # Millisecond ticks cover ~49 days; anything longer falls back to seconds
+    tick = 0.001 if span < (TIME_MISSING - 1) / 1000 else 1.0
+    offsets = np.full(n, TIME_MISSING, dtype=np.uint32)
+    offsets[known_time] = np.round((time[known_time] - start) / tick)
+
+    flags = 0
+    if not np.isnan(elevation).all():
+        flags |= FLAG_ELEVATION
+    if known_time.any():
+        flags |= FLAG_TIME
+
+    name = (columns.name or "").encode()[:0xFFFF]
+    header = HEADER.pack(
+        MAGIC, VERSION, flags, n, start, tick, columns.tz_offset, len(name)
+    )
+    header += name + b"\0" * (-(len(header) + len(name)) % 4)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(np.round(lat * COORD_SCALE).astype("<i4").tobytes())
+        f.write(np.round(lon * COORD_SCALE).astype("<i4").tobytes())
+        f.write(elevation.astype("<f4").tobytes())
+        f.write(offsets.astype("<u4").tobytes())
+    os.replace(tmp_path, path)
+
+
+class StoredTrack(Sequence):
+    """Memory-mapped binary track.
+
+    The raw columns (``lat_e7``, ``lon_e7``, ``elevation``, ``time_ticks``)
+    are read-only numpy views of the file, so opening a track costs a header
+    read whatever its size. Like TrackPoints it is also a sequence of point
+    dicts, so calculate_metrics and build_series accept it directly.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            # The map keeps its own reference to the file
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, flags, n, start, tick, tz_offset, name_len = HEADER.unpack_from(
+            self._map
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a track file: {path}")
+        offset = HEADER.size
+        self.name = bytes(self._map[offset : offset + name_len]).decode() or None
+        offset += name_len + (-(HEADER.size + name_len) % 4)
+
+        self.flags = flags
+        self.start = start
+        self.tick = tick
+        self.tz_offset = tz_offset
+        self._tz = timezone(timedelta(seconds=tz_offset))
+
+        def column(dtype: str) -> np.ndarray:
+            nonlocal offset
+            view = np.frombuffer(self._map, dtype=dtype, count=n, offset=offset)
+            offset += view.nbytes
+            return view
+
+        self.lat_e7 = column("<i4")
+        self.lon_e7 = column("<i4")
+        self.elevation = column("<f4")
+        self.time_ticks = column("<u4")
+
+    @property
+    def has_elevation(self) -> bool:
+        return bool(self.flags & FLAG_ELEVATION)
+
+    @property
+    def has_time(self) -> bool:
+        return bool(self.flags & FLAG_TIME)
+
+    def __len__(self) -> int:
+        return len(self.lat_e7)
+
+    def __repr__(self) -> str:
+        return f"StoredTrack(n={len(self)})"
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # float64 lat/lon/elevation/epoch-seconds (NaN = missing), the same
+        # shape points_as_arrays returns for parsed tracks
+        time = self.time_ticks * self.tick + self.start
+        time[self.time_ticks == TIME_MISSING] = np.nan
+        return (
+            self.lat_e7 / COORD_SCALE,
+            self.lon_e7 / COORD_SCALE,
+            self.elevation.astype(np.float64),
+            time,
+        )
+
+    def _point(self, i: int) -> dict[str, Any]:
+        elevation = float(self.elevation[i])
+        ticks = int(self.time_ticks[i])
+        return {
+            "lat": int(self.lat_e7[i]) / COORD_SCALE,
+            "lon": int(self.lon_e7[i]) / COORD_SCALE,
+            "elevation": None if np.isnan(elevation) else elevation,
+            "time": (
+                None
+                if ticks == TIME_MISSING
+                else datetime.fromtimestamp(self.start + ticks * self.tick, self._tz)
+            ),
+        }
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._point(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("point index out of range")
+        return self._point(index)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for i in range(len(self)):
+            yield self._point(i)
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # Views handed out are still alive; the map closes with them
+            pass
+
+
+def open_track(path: str) -> StoredTrack | None:
+    try:
+        return StoredTrack(path)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+import config
+from bot.services.profiling import profiler, run_profiled
+
+logger = logging.getLogger(__name__)
+
+
+class JobTimeoutError(TimeoutError):
+    pass
+
+
+def _noop():
+    return None
+
+
+def _terminate(executor: ProcessPoolExecutor):
+    # ProcessPoolExecutor has no public way to stop a running job; kill its
+    # processes, then let it fail whatever was still queued
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class WorkerPool:
+    """Process pool for CPU-bound jobs with a per-job timeout.
+
+    A job that times out is not just abandoned: the pool is recycled, i.e.
+    its processes are terminated and a fresh, warmed pool takes its place.
+    An executor can't lose one worker without breaking, so jobs running
+    alongside the stuck one fail with ``BrokenProcessPool`` (callers treat
+    that as retryable). The same replacement happens when a worker dies.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_jobs: int,
+        timeout: float,
+        initializer: Callable[[], None] | None = None,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.max_jobs = max(1, max_jobs)
+        self.timeout = timeout
+        self.initializer = initializer
+        self._executor: ProcessPoolExecutor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._replace_lock = asyncio.Lock()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer,
+        )
+
+    def _ensure_executor(self):
+        # Worker processes are spawned lazily by the executor on first submit
+        if self._executor is None:
+            self._executor = self._create_executor()
+            self._semaphore = asyncio.Semaphore(self.max_jobs)
+
+    async def start(self):
+        self._ensure_executor()
+        await self.warm()
+
+    async def warm(self):
+        # Each submit with no idle worker spawns a new process, so one job per
+        # worker brings the whole pool up and runs the initializer everywhere
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, _noop)
+                for _ in range(self.max_workers)
+            )
+        )
+        logger.info("Worker pool ready: %d processes", self.max_workers)
+
+    async def run(
+        self, func: Callable[..., Any], *args: Any, profile: bool = False
+    ) -> Any:
+        # profile: run under cProfile in the worker and publish the report;
+        # callers pass profiler.take("jobs") for the jobs /profile targets
+        self._ensure_executor()
+
+        call = (run_profiled, func) if profile else (func,)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            # The pool this job went to; by the time it fails another job may
+            # already have replaced it
+            executor = self._executor
+            future = loop.run_in_executor(executor, *call, *args)
+            try:
+                result = await asyncio.wait_for(future, self.timeout)
+            except TimeoutError:
+                # The worker is still busy with the job; free the slot
+                await self._replace(executor, f"{func.__name__} timed out")
+                raise JobTimeoutError(
+                    f"{func.__name__} timed out after {self.timeout:.0f} s"
+                ) from None
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a huge file)
+                await self._replace(executor, "worker died")
+                raise
+
+        if profile:
+            result, report = result
+            await profiler.publish(report)
+        return result
+
+    async def _replace(self, executor: ProcessPoolExecutor, reason: str):
+        # Every job of a broken pool fails at once; only the first replaces it
+        async with self._replace_lock:
+            if self._executor is not executor:
+                return
+            logger.error("Restarting worker pool: %s", reason)
+            self._executor = self._create_executor()
+            _terminate(executor)
+            try:
+                await self.warm()
+            except Exception:
+                logger.exception("Failed to warm the new worker pool")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _init_ingest_worker():
+    from bot.services.ingest import warm_up
+    from bot.services.logs import setup_logging
+
+    # Spawned workers start with logging unconfigured
+    setup_logging()
+    warm_up()
+
+
+ingest_pool = WorkerPool(
+    max_workers=config.INGEST_WORKERS,
+    max_jobs=config.INGEST_MAX_JOBS,
+    timeout=config.INGEST_TIMEOUT,
+    initializer=_init_ingest_worker,
+)
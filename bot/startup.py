@@ -0,0 +1,114 @@
+"""Start-up timing.
+
+    python -m bot.startup            # import cost of bot.main per module
+    python -m bot.startup --top 40
+
+The running bot logs how long each start-up step took once the dispatcher
+is up; the command above runs ``python -X importtime`` in a fresh
+interpreter to show which modules the steps spend their time on.
+"""
+
+import argparse
+import importlib
+import logging
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from types import ModuleType
+
+logger = logging.getLogger(__name__)
+
+# Only needed once a track is handled; imported in the background after the
+# dispatcher starts so the first upload doesn't pay for them
+PREWARM_MODULES = (
+    "numpy",
+    "bot.services.track_store",
+    "bot.services.calculator",
+)
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps: list[tuple[str, float]] = []
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - started))
+
+    def import_module(self, name: str) -> ModuleType:
+        with self.step(f"import {name}"):
+            return importlib.import_module(name)
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.started
+        # Measured from this module's import, i.e. after aiogram has loaded
+        lines = [f"Ready in {total * 1000:.0f} ms after imports"]
+        for name, seconds in self.steps:
+            lines.append(f"{seconds * 1000:8.1f} ms  {name}")
+        return "\n  ".join(lines)
+
+
+startup = StartupTimer()
+
+
+def _prewarm(modules: Sequence[str]):
+    started = time.perf_counter()
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning("Prewarm: failed to import %s: %s", name, e)
+    logger.info("Prewarmed imports in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+def prewarm(modules: Sequence[str] = PREWARM_MODULES) -> threading.Thread:
+    # The import lock makes a handler that needs one of these modules wait
+    # for the thread instead of importing it a second time
+    thread = threading.Thread(
+        target=_prewarm, args=(modules,), name="prewarm", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def import_costs(module: str = "bot.main") -> list[tuple[str, int, int]]:
+    # (module, self us, cumulative us) from -X importtime, in import order
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    costs = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        costs.append((name.strip(), int(own), int(cumulative)))
+    return costs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import cost per module")
+    parser.add_argument("--module", default="bot.main")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args(argv)
+
+    costs = import_costs(args.module)
+    total = max(cumulative for _, _, cumulative in costs)
+    print(f"import {args.module}: {total / 1000:.0f} ms")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for name, own, cumulative in sorted(costs, key=lambda c: -c[2])[: args.top]:
+        print(f"{cumulative / 1000:10.1f} ms {own / 1000:7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from multiprocessing.process import BaseProcess
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Webhook mode with WEBHOOK_WORKERS > 1: this process only sets the webhook,
+# migrates the database and looks after the workers; each worker is a full
+# bot (dispatcher, ingest pool) listening on port 8000 with SO_REUSEPORT.
+#
+# Workers share the SQLite database. WAL lets their readers run alongside
+# the single writer, and BEGIN IMMEDIATE plus busy_timeout make a writer in
+# one process wait for a writer in another instead of failing. Migrations
+# run here, once, before any worker starts.
+#
+#   SIGHUP           restart the workers one at a time (picks up new code;
+#                    the others keep serving meanwhile)
+#   SIGTERM, SIGINT  stop every worker gracefully and exit
+
+READY_TIMEOUT = 60.0
+# Seconds to wait before restarting a worker that died, by consecutive crash
+RESTART_BACKOFF = (1, 2, 5, 10, 30)
+# A worker that ran this long before dying is not considered crash-looping
+STABLE_AFTER = 60.0
+
+
+def _worker_main(slot: int, ready):
+    from bot.main import serve
+
+    asyncio.run(serve(worker=slot, ready=ready))
+
+
+class Supervisor:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: dict[int, BaseProcess] = {}
+        self.started_at: dict[int, float] = {}
+        self.crashes: dict[int, int] = {}
+        self._stopping: asyncio.Event | None = None
+        self._restart: asyncio.Task | None = None
+
+    async def start_worker(self, slot: int) -> bool:
+        ready = self.context.Event()
+        process = self.context.Process(
+            target=_worker_main, args=(slot, ready), name=f"worker-{slot}"
+        )
+        process.start()
+        self.processes[slot] = process
+        self.started_at[slot] = time.monotonic()
+
+        deadline = time.monotonic() + READY_TIMEOUT
+        while not ready.is_set():
+            if not process.is_alive() or time.monotonic() > deadline:
+                logger.error("Worker %d (pid %d) failed to start", slot, process.pid)
+                # A hung worker would keep the slot, and the shared port,
+                # alongside whatever replaces it
+                await self.stop_worker(slot)
+                return False
+            await asyncio.sleep(0.1)
+        logger.info("Worker %d ready (pid %d)", slot, process.pid)
+        return True
+
+    async def stop_worker(self, slot: int):
+        process = self.processes.get(slot)
+        if process is None:
+            return
+        if process.is_alive():
+            # SIGTERM: the worker closes its sockets, finishes the updates it
+            # is handling and exits
+            process.terminate()
+            deadline = time.monotonic() + config.WORKER_SHUTDOWN_TIMEOUT + 10
+            while process.is_alive() and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+            if process.is_alive():
+                logger.warning("Worker %d did not stop in time, killing", slot)
+                process.kill()
+        process.join()
+        # Only forgotten once it is gone, so a cancelled stop is finished by
+        # the final shutdown
+        self.processes.pop(slot, None)
+
+    async def rolling_restart(self):
+        logger.info("Rolling restart of %d workers", self.workers)
+        for slot in range(self.workers):
+            if self._stopping.is_set():
+                return
+            await self.stop_worker(slot)
+            if not await self.start_worker(slot):
+                # Keep the remaining old workers rather than replacing them
+                # all with a build that doesn't start
+                logger.error("Rolling restart aborted at worker %d", slot)
+                return
+        logger.info("Rolling restart done")
+
+    def _on_sighup(self):
+        if self._restart is None or self._restart.done():
+            self._restart = asyncio.create_task(self.rolling_restart())
+
+    async def watch(self):
+        # Replace workers that exited on their own, backing off if one keeps
+        # crashing
+        while not self._stopping.is_set():
+            await asyncio.sleep(1)
+            if self._restart is not None and not self._restart.done():
+                continue
+            for slot in range(self.workers):
+                process = self.processes.get(slot)
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None:
+                    process.join()
+                    logger.error(
+                        "Worker %d (pid %d) exited with code %s",
+                        slot,
+                        process.pid,
+                        process.exitcode,
+                    )
+                    del self.processes[slot]
+                    uptime = time.monotonic() - self.started_at[slot]
+                    await self.back_off(slot, stable=uptime > STABLE_AFTER)
+                if self._stopping.is_set():
+                    return
+                if not await self.start_worker(slot):
+                    # Already stopped and removed by start_worker
+                    await self.back_off(slot, stable=False)
+
+    async def back_off(self, slot: int, stable: bool):
+        crashes = 1 if stable else self.crashes.get(slot, 0) + 1
+        self.crashes[slot] = crashes
+        await asyncio.sleep(RESTART_BACKOFF[min(crashes, len(RESTART_BACKOFF)) - 1])
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stopping.set)
+        loop.add_signal_handler(signal.SIGHUP, self._on_sighup)
+
+        for slot in range(self.workers):
+            await self.start_worker(slot)
+        watcher = asyncio.create_task(self.watch())
+
+        await self._stopping.wait()
+        watcher.cancel()
+        if self._restart is not None:
+            self._restart.cancel()
+        logger.info("Stopping %d workers", len(self.processes))
+        await asyncio.gather(*(self.stop_worker(slot) for slot in list(self.processes)))
+
+
+async def supervise(workers: int):
+    from aiogram import Bot
+
+    from database.db import db
+
+    config.ensure_dirs()
+    db.init_db()
+    # Workers open their own connections
+    db.close()
+
+    bot = Bot(token=config.BOT_TOKEN)
+    try:
+        await bot.set_webhook(url=config.WEBHOOK_URL)
+        logger.info("Webhook set to %s", config.WEBHOOK_URL)
+    finally:
+        await bot.session.close()
+
+    await Supervisor(workers).run()
@@ -8,11 +8,75 @@ ADMIN_ID = int(os.getenv("ADMIN_ID", 0))
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Webhook mode: dispatcher processes sharing port 8000. With more than one,
+# each also serves /health and /metrics on WORKER_PORT_BASE + its index
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 1))
+WORKER_PORT_BASE = int(os.getenv("WORKER_PORT_BASE", 8100))
+# How long a stopping process waits for updates it is still handling
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", 60))
 
 DATA_DIR = "data"
 TRACKS_DIR = os.path.join(DATA_DIR, "tracks")
 MEDIA_DIR = os.path.join(DATA_DIR, "media")
 GRAPHICS_DIR = os.path.join(DATA_DIR, "graphics")
+PROFILES_DIR = os.path.join(DATA_DIR, "profiles")
 
-for dir_path in [DATA_DIR, TRACKS_DIR, MEDIA_DIR, GRAPHICS_DIR]:
-    os.makedirs(dir_path, exist_ok=True)
+
+def ensure_dirs():
+    # Called at start-up rather than on import, so scripts and worker
+    # processes that only read config don't touch the filesystem
+    for dir_path in [DATA_DIR, TRACKS_DIR, MEDIA_DIR, GRAPHICS_DIR]:
+        os.makedirs(dir_path, exist_ok=True)
+
+
+# GPX ingest runs in a process pool so large tracks don't block the event loop.
+# A job over INGEST_TIMEOUT seconds gets the pool's processes restarted
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", INGEST_WORKERS))
+INGEST_TIMEOUT = float(os.getenv("INGEST_TIMEOUT", 120))
+# Uploads go through a job queue in SQLite: how many jobs each process runs
+# at once, how many attempts a job gets for network/Telegram/worker errors
+# and the first retry delay (seconds, doubled on every further attempt)
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", INGEST_MAX_JOBS))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", 5))
+
+# Upper bound for rendered infographics in GRAPHICS_DIR, least recently used
+# images are evicted first
+GRAPHICS_CACHE_MAX_MB = int(os.getenv("GRAPHICS_CACHE_MAX_MB", 200))
+
+# How many media albums (up to 10 items each) are sent to Telegram at once
+MEDIA_ALBUM_CONCURRENCY = int(os.getenv("MEDIA_ALBUM_CONCURRENCY", 3))
+
+# Outbound Bot API limits: messages per second to one chat and in total
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", 1))
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 25))
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", 3))
+
+# Bulk import: GPX files inside an archive larger than this are rejected
+IMPORT_MAX_FILE_MB = int(os.getenv("IMPORT_MAX_FILE_MB", 50))
+
+# Polling mode has no /metrics route; log a metrics digest this often (s)
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", 300))
+
+# Import numpy and spawn/warm the ingest workers in the background once the
+# dispatcher is running, instead of on the first GPX upload
+PREWARM = os.getenv("PREWARM", "true").lower() in ("1", "true", "yes")
+
+# Log level, cap on one log message and how many records with the same
+# message template are let through per minute (warnings and errors always)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", 4000))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", 30))
+
+# Profile the next N ingest jobs / handler calls after start-up (also armed
+# at runtime with /profile); reports go to PROFILES_DIR and the admin chat
+PROFILE_JOBS = int(os.getenv("PROFILE_JOBS", 0))
+PROFILE_HANDLERS = int(os.getenv("PROFILE_HANDLERS", 0))
+
+# FSM state storage: states untouched this long (seconds) are dropped, how
+# many chats are kept in memory, and how often changes are written to SQLite
+# (0 = on every change)
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", 7 * 24 * 3600))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 1000))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 1.0))
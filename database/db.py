@@ -1,48 +1,267 @@
+import asyncio
+import functools
+import queue
 import sqlite3
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+    # 16 MB page cache per connection; SQLite's shared-cache mode would make
+    # WAL readers block on the writer with SQLITE_LOCKED, so each long-lived
+    # connection keeps its own, larger cache instead
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
 
 
 class Database:
-    def __init__(self, db_path: str = "geobot.db"):
+    # One long-lived writer (SQLite allows a single writer anyway) plus a small
+    # pool of readers, which WAL lets run concurrently with the writer
+
+    def __init__(self, db_path: str = "geobot.db", readers: int = 4):
         self.db_path = db_path
-        self.init_db()
+        self.readers = max(1, readers)
+        self._writer: sqlite3.Connection | None = None
+        self._write_lock = threading.RLock()
+        self._idle_readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._all_readers: list[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        # Async callers hop onto these threads so the event loop never waits
+        # on SQLite; one extra thread for the writer
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.readers + 1, thread_name_prefix="db"
+        )
+        # Connections are opened on first use and the schema is migrated by an
+        # explicit init_db() call at start-up, so importing this is cheap
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly in transaction()
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, isolation_level=None
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+
+            if conn.in_transaction:
+                # Nested call from the same thread joins the outer transaction
+                yield conn
+                return
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
 
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._idle_readers.put(conn)
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if len(self._all_readers) < self.readers:
+                conn = self._connect()
+                self._all_readers.append(conn)
+                return conn
+        return self._idle_readers.get()
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def batch(self, *calls: Callable[[], Any]) -> list[Any]:
+        # Several queries for one handler in a single thread hop
+        return await self.run(lambda: [call() for call in calls])
+
+    def close(self):
+        with self._write_lock, self._pool_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers.clear()
+            self._idle_readers = queue.LifoQueue()
 
     def init_db(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trips (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                trip_date DATE,
-                distance REAL,
-                duration INTEGER,
-                avg_speed REAL,
-                max_speed REAL,
-                min_elevation REAL,
-                max_elevation REAL,
-                elevation_gain REAL,
-                gpx_path TEXT,
-                notes TEXT
-            )
-        """
-        )
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trip_media (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                trip_id INTEGER NOT NULL,
-                file_path TEXT NOT NULL,
-                media_type TEXT NOT NULL,
-                FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE
-            )
-        """
-        )
-        conn.commit()
-        conn.close()
+        # PRAGMA user_version records how many MIGRATIONS have been applied,
+        # so an up-to-date database costs one read at startup
+        with self.read() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(MIGRATIONS):
+            return
+
+        with self.transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for statements in MIGRATIONS[version:]:
+                for statement in statements:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+
+# Aggregates trips into trip_daily_rollup rows; callers add WHERE / GROUP BY
+ROLLUP_SELECT = """
+    SELECT trip_date,
+           COUNT(*),
+           COALESCE(SUM(distance), 0),
+           COALESCE(SUM(duration), 0),
+           COALESCE(SUM(avg_speed), 0),
+           COUNT(avg_speed),
+           MAX(max_speed)
+    FROM trips
+"""
+
+# Append-only: each entry moves the schema one version forward. The first one
+# uses IF NOT EXISTS because it also runs on databases created before
+# versioning was introduced.
+MIGRATIONS = [
+    (
+        """
+        CREATE TABLE IF NOT EXISTS trips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            trip_date DATE,
+            distance REAL,
+            duration INTEGER,
+            avg_speed REAL,
+            max_speed REAL,
+            min_elevation REAL,
+            max_elevation REAL,
+            elevation_gain REAL,
+            gpx_path TEXT,
+            notes TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trip_media (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trip_id INTEGER NOT NULL,
+            file_path TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trip_series (
+            trip_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE
+        )
+        """,
+    ),
+    (
+        # Serves ORDER BY trip_date DESC, id DESC and keyset seeks without a
+        # sort or a scan
+        "CREATE INDEX idx_trips_date_id ON trips (trip_date, id)",
+        # Covers per-trip media lookups and counts by type
+        "CREATE INDEX idx_trip_media_trip ON trip_media (trip_id, media_type)",
+    ),
+    (
+        # Per-day aggregates for /stats, kept in sync by Trip.create/delete
+        """
+        CREATE TABLE trip_daily_rollup (
+            trip_date DATE PRIMARY KEY,
+            trip_count INTEGER NOT NULL,
+            distance_sum REAL NOT NULL,
+            duration_sum INTEGER NOT NULL,
+            avg_speed_sum REAL NOT NULL,
+            avg_speed_count INTEGER NOT NULL,
+            max_speed REAL
+        )
+        """,
+        f"INSERT INTO trip_daily_rollup {ROLLUP_SELECT} GROUP BY trip_date",
+    ),
+    (
+        # Telegram file_ids: once a file has been sent it can be re-sent by id
+        # without uploading the bytes again
+        "ALTER TABLE trip_media ADD COLUMN file_id TEXT",
+        """
+        CREATE TABLE trip_graphic_file_ids (
+            trip_id INTEGER PRIMARY KEY,
+            cache_key TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE
+        )
+        """,
+    ),
+    (
+        # Content addresses: a re-uploaded track is found by hash before it is
+        # parsed, identical media files are stored once and reference-counted
+        "ALTER TABLE trips ADD COLUMN gpx_sha256 TEXT",
+        "CREATE UNIQUE INDEX idx_trips_gpx_sha256 ON trips (gpx_sha256)",
+        "ALTER TABLE trip_media ADD COLUMN sha256 TEXT",
+        """
+        CREATE TABLE media_blobs (
+            sha256 TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            refcount INTEGER NOT NULL
+        )
+        """,
+    ),
+    (
+        # FSM state per chat/user (bot.services.fsm_storage), data as JSON
+        """
+        CREATE TABLE fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX idx_fsm_states_updated_at ON fsm_states (updated_at)",
+    ),
+    (
+        # GPX ingest queue (bot.services.ingest_queue); payload is JSON
+        """
+        CREATE TABLE ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            chat_id INTEGER NOT NULL,
+            status_message_id INTEGER,
+            file_id TEXT NOT NULL,
+            file_name TEXT,
+            status TEXT NOT NULL,
+            stage TEXT,
+            payload TEXT NOT NULL DEFAULT '{}',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_run_at REAL NOT NULL,
+            error TEXT,
+            owner TEXT,
+            lease_until REAL
+        )
+        """,
+        "CREATE INDEX idx_ingest_jobs_status ON ingest_jobs (status, next_run_at)",
+    ),
+]
 
 
 db = Database()
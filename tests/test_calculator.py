@@ -0,0 +1,50 @@
+import math
+
+import pytest
+
+from benchmarks.synthetic import generate_points, to_track_points
+from bot.services.calculator import (
+    PARITY_RTOL,
+    calculate_metrics,
+    calculate_metrics_scalar,
+)
+
+
+def assert_parity(points):
+    fast = calculate_metrics(points)
+    reference = calculate_metrics_scalar(points)
+
+    assert fast.keys() == reference.keys()
+    for key, expected in reference.items():
+        actual = fast[key]
+        if isinstance(expected, float):
+            assert math.isclose(actual, expected, rel_tol=PARITY_RTOL), key
+        elif key == "duration":
+            assert abs(actual - expected) <= 1, key
+        else:
+            assert actual == expected, key
+
+
+@pytest.mark.parametrize("with_time", [True, False])
+@pytest.mark.parametrize("with_elevation", [True, False])
+def test_parity_on_synthetic_track(with_elevation, with_time):
+    points = generate_points(500, with_elevation, with_time)
+    assert_parity(points)
+    # parse_gpx hands the engine columnar points
+    assert_parity(to_track_points(points))
+
+
+def test_parity_on_two_points_without_timestamps():
+    points = generate_points(2, with_elevation=True, with_time=False)
+    assert_parity(points)
+    metrics = calculate_metrics(points)
+    assert metrics["avg_speed"] is None
+    assert metrics["max_speed"] is None
+
+
+@pytest.mark.parametrize("n", [0, 1])
+def test_too_few_points_rejected_by_both(n):
+    points = generate_points(n)
+    for calculate in (calculate_metrics, calculate_metrics_scalar):
+        with pytest.raises(ValueError):
+            calculate(points)